@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Apr 24 21:16:40 2024
+
+@author: jlkc1
+"""
+
+import os
+import csv
+import time
+import random
+import threading
+
+# Class is used to remember the activities already suggested during a session. Each group is drawn with a partial Fisher-Yates shuffle, so every draw is O(1).
+class ActivitySession():
+
+    def __init__(self, rng=None):
+        self.rng = rng if rng is not None else random.Random()
+        # (index version, group key) -> [number of drawn activities, swapped positions]
+        self.draws = {}
+        self.suggested = set()
+
+    # Function is used to draw the position of the next activity of a group, or None if every activity of the group was suggested.
+    def draw(self, version, key, size):
+        state = self.draws.setdefault((version, key), [0, {}])
+        drawn, swaps = state
+        if drawn >= size:
+            return None
+        i = drawn + self.rng.randrange(size - drawn)
+        position = swaps.get(i, i)
+        swaps[i] = swaps.get(drawn, drawn)
+        swaps.pop(drawn, None)
+        state[0] = drawn + 1
+        return position
+
+    # Function is used to forget the activities drawn from a group, so they can be suggested again.
+    def reset(self, version, key):
+        self.draws.pop((version, key), None)
+
+# Class is used to keep the activity list in memory, grouped by (Mood, Indoor/Outdoor, Category). The file is reloaded when it changes.
+class ActivityIndex():
+
+    def __init__(self, path, reload_interval=2.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.lock = threading.Lock()
+        self.groups = {}
+        self.version = 0
+        self.file_state = None
+        self.checked_at = 0.0
+        self.load()
+
+    # Function is used to read the activity file and group the activities. A group without category holds every category.
+    def load(self):
+        stat = os.stat(self.path)
+        groups = {}
+        with open(self.path, "r", encoding='latin-1', newline='') as f:
+            for row in csv.DictReader(f):
+                activity = {name: value.strip() for name, value in row.items() if name is not None}
+                mood = activity['Mood'].lower()
+                place = activity['Indoor/Outdoor'].lower()
+                category = activity.get('Category', '').lower()
+                groups.setdefault((mood, place, category), []).append(activity)
+                groups.setdefault((mood, place, None), []).append(activity)
+        with self.lock:
+            self.groups = {key: tuple(group) for key, group in groups.items()}
+            self.version += 1
+            self.file_state = (stat.st_mtime_ns, stat.st_size)
+            self.checked_at = time.monotonic()
+
+    # Function is used to reload the activity file if it changed. The file is checked at most once per reload interval.
+    def reload_if_changed(self):
+        if time.monotonic() - self.checked_at < self.reload_interval:
+            return False
+        self.checked_at = time.monotonic()
+        stat = os.stat(self.path)
+        if (stat.st_mtime_ns, stat.st_size) == self.file_state:
+            return False
+        self.load()
+        return True
+
+    # Function is used to get the number of activities of a group.
+    def count(self, mood, place, category=None):
+        return len(self.groups.get((mood, place, category), ()))
+
+    # Function is used to pick up to k random activities that were not suggested yet during the session.
+    def sample(self, mood, place, session, k=1, category=None):
+        self.reload_if_changed()
+        with self.lock:
+            version = self.version
+            group = self.groups.get((mood, place, category), ())
+        key = (mood, place, category)
+        activities = []
+        restarted = False
+        while len(activities) < k and group:
+            position = session.draw(version, key, len(group))
+            if position is None:
+                # Every activity was suggested, so the suggestions start over.
+                if restarted:
+                    break
+                restarted = True
+                session.reset(version, key)
+                session.suggested.difference_update(activity['Activities'] for activity in group)
+                session.suggested.update(activity['Activities'] for activity in activities)
+                continue
+            activity = group[position]
+            if activity['Activities'] in session.suggested:
+                continue
+            session.suggested.add(activity['Activities'])
+            activities.append(activity)
+        return activities
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Apr 16 19:12:05 2024
+
+@author: jlkc1
+"""
+
+import os
+import io
+import hashlib
+import threading
+from collections import OrderedDict
+from Lazy_Import import lazy_import
+from Tracing import metrics
+
+gtts = lazy_import('gtts')
+
+tts_cache_dir = 'tts_cache'
+tts_cache_max_bytes = 50 * 1024 * 1024
+
+# Class is used to keep the synthesized speech on disk, addressed by the content of the text, with a size-bounded LRU eviction.
+class AudioCache():
+
+    def __init__(self, cache_dir=f"""{os.getcwd()}/{tts_cache_dir}""", max_bytes=tts_cache_max_bytes, lang='en', slow=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lang = lang
+        self.slow = slow
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        # The files are ordered by their last access, so the LRU order is kept between runs.
+        self.entries = OrderedDict()
+        files = [f for f in os.listdir(cache_dir) if f.endswith('.mp3')]
+        for name in sorted(files, key=lambda f: os.stat(f"""{cache_dir}/{f}""").st_mtime):
+            self.entries[name[:-4]] = os.stat(f"""{cache_dir}/{name}""").st_size
+        self.size = sum(self.entries.values())
+
+    # Function is used to get the key of a text. The voice settings are part of the key.
+    def key(self, text):
+        return hashlib.sha256(f"""{self.lang}\t{self.slow}\t{text}""".encode('utf-8')).hexdigest()
+
+    # Function is used to get the path of a cached audio file.
+    def path(self, key):
+        return f"""{self.cache_dir}/{key}.mp3"""
+
+    # Function is used to check if a text is already cached.
+    def contains(self, text):
+        return self.key(text) in self.entries
+
+    # Function is used to get the audio of a text. The text is only synthesized if it is not cached yet.
+    def get(self, text):
+        key = self.key(text)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                metrics.increment('cache_hits_total', cache='audio')
+                os.utime(self.path(key))
+                with open(self.path(key), "rb") as f:
+                    return f.read()
+            self.misses += 1
+            metrics.increment('cache_misses_total', cache='audio')
+        data = self.synthesize(text)
+        self.put(key, data)
+        return data
+
+    # Function is used to convert text to speech with gTTS.
+    def synthesize(self, text):
+        buffer = io.BytesIO()
+        metrics.increment('network_calls_total', service='gtts')
+        gtts.gTTS(text=text, lang=self.lang, slow=self.slow).write_to_fp(buffer)
+        return buffer.getvalue()
+
+    # Function is used to save the audio of a text and evict the least recently used files above the size limit.
+    def put(self, key, data):
+        tmp_path = self.path(key) + '.tmp'
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path(key))
+        with self.lock:
+            self.size += len(data) - self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                old_key, old_size = self.entries.popitem(last=False)
+                self.size -= old_size
+                if os.path.exists(self.path(old_key)):
+                    os.remove(self.path(old_key))
+
+    # Function is used to pre-render a list of prompts. It returns the number of prompts that had to be synthesized.
+    def build(self, texts):
+        rendered = 0
+        for text in dict.fromkeys(texts):
+            if text and not self.contains(text):
+                self.get(text)
+                rendered += 1
+        return rendered
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Apr 28 17:45:21 2024
+
+@author: jlkc1
+"""
+
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+# Class is used to group the calls made by concurrent sessions into batched forward passes. A batch is run when it is full or when its oldest call waited max_wait_ms.
+class MicroBatcher():
+
+    def __init__(self, function, max_batch_size=16, max_wait_ms=5, name='batcher'):
+        # The function takes a list of inputs and returns one output per input, in the same order.
+        self.function = function
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self.thread = threading.Thread(target=self.worker, name=f"""va-{name}""", daemon=True)
+        self.thread.start()
+
+    # Function is used to queue an input. The returned future gets the output once the batch has run.
+    def submit(self, item):
+        future = Future()
+        self.queue.put((item, future))
+        return future
+
+    # Function is used to run one input through the batcher and wait for its output.
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    # Function is used to collect the queued inputs into batches and run them.
+    def worker(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.run_batch(batch)
+
+    # Function is used to run a batch and give each caller its output.
+    def run_batch(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            outputs = self.function(items)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.items += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for (_, future), output in zip(batch, outputs):
+            future.set_result(output)
+
+    # Function is used to report how well the calls were batched.
+    def get_stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'average_batch_size': round(self.items / self.batches, 2) if self.batches else 0,
+            'largest_batch': self.largest_batch,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+        }
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri May 10 20:34:12 2024
+
+@author: jlkc1
+"""
+
+import os
+import csv
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+from Model_Registry import registry
+from Stand_In_Models import register_stand_in_models, StandInEncoder
+from Movie_Index import create_index, index_parameters, movie_index_type, index_types
+from Movie_Store import write_movie_store, load_movie_store
+from Activity_Index import ActivitySession
+from Preprocessing_Movie_Dataset import load_movie_dataset, movie_plot_treshold
+from Headless_Session import HeadlessAssistant, latency_percentiles, session_files
+
+benchmark_sizes = [5000, 50000, 200000, 1000000]
+benchmark_batch_sizes = [1, 4, 16, 64]
+benchmarks = ['search', 'classifiers', 'activity', 'preprocessing']
+# Smallest budget per unit, so a metric measured near zero does not fail on noise.
+budget_floors = {'_ms': 1.0, '_seconds': 0.1, '_mb': 10.0}
+
+# Classifier of the model registry used by each classifier method of the Virtual Assistant.
+classifier_methods = {
+    'emotion_detection': 'emotion',
+    'sentiment_detection': 'sentiment',
+    'yes_no_question': 'yes_no',
+}
+
+# Words of the synthetic plots and sentences. None of them contains 'yes' or 'no', so yes_no_question always runs its classifier.
+benchmark_words = [
+    'friends', 'family', 'space', 'dragon', 'love', 'war', 'detective', 'city', 'music', 'school',
+    'island', 'robot', 'journey', 'secret', 'king', 'summer', 'ghost', 'race', 'heist', 'comedy',
+    'drama', 'adventure', 'mystery', 'romance', 'funny', 'dark', 'epic', 'small', 'town', 'ocean',
+    'forest', 'teacher', 'doctor', 'soldier', 'artist', 'village', 'night', 'storm', 'dream', 'road',
+    'happy', 'sad', 'scared', 'angry', 'great', 'boring', 'sure', 'like', 'tired', 'excited',
+]
+
+# Function is used to make a random sentence of the benchmark words.
+def random_sentence(rng, length=6):
+    return ' '.join(rng.choice(benchmark_words, length))
+
+# Function is used to get the peak memory of the process in MB. None is returned where it cannot be measured.
+def peak_memory_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes and macOS bytes.
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+# Function is used to create a catalogue of random normalized embeddings, with a title and a plot for every movie.
+def synthetic_catalogue(size, dimension, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.standard_normal((size, dimension), dtype='float32')
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    words = np.array(benchmark_words)
+    df = pd.DataFrame({
+        'id': np.arange(1, size + 1, dtype='int64'),
+        'title': [f"""Movie {i}""" for i in range(1, size + 1)],
+        'summarization': [' '.join(row) for row in words[rng.integers(0, len(words), (size, 12))]],
+    })
+    return df, embeddings
+
+# Function is used to time the movie search on synthetic catalogues. Every query is new, so the query cache is never hit.
+def benchmark_search(va, sizes, dimension, index_type=movie_index_type, num_queries=50, top_k=5, seed=0):
+    rng = np.random.default_rng(seed)
+    model = registry.get('movie_encoder')
+    dataset_path = f"""{va.cwd}/preprocessed_movie_dataset.csv"""
+    results = {}
+    query_count = 0
+    for size in sizes:
+        df, embeddings = synthetic_catalogue(size, dimension, seed)
+        df.to_csv(dataset_path, index=False)
+        write_movie_store(df, dataset_path, va.cwd)
+        movie_store = load_movie_store(dataset_path, va.cwd)
+        start = time.perf_counter()
+        index = create_index(embeddings, df['id'].to_numpy(dtype='int64'), index_parameters(index_type, size, dimension))
+        result = {'build_seconds': round(time.perf_counter() - start, 3)}
+        del df, embeddings
+        # One query is a search on keywords, three queries a search on the preferences of a mood.
+        for num_preferences in [1, 3]:
+            latencies = []
+            for i in range(num_queries):
+                queries = []
+                for j in range(num_preferences):
+                    query_count += 1
+                    queries.append(f"""{random_sentence(rng, 4)} {query_count}""")
+                start = time.perf_counter()
+                va.search(movie_store, queries, top_k, index, model)
+                latencies.append(time.perf_counter() - start)
+            result[f"""{num_preferences}_queries"""] = latency_percentiles(latencies)
+        result['memory_mb'] = peak_memory_mb()
+        results[str(size)] = result
+        del index, movie_store
+    return results
+
+# Function is used to time the classifiers. A batch of one goes through the method of the Virtual Assistant, larger batches through the classifier, as in the micro-batcher of the server.
+def benchmark_classifiers(va, batch_sizes, repeats=20, seed=0):
+    rng = np.random.default_rng(seed)
+    results = {}
+    for method, name in classifier_methods.items():
+        classifier = registry.get(name)
+        results[method] = {}
+        for batch_size in batch_sizes:
+            latencies = []
+            for i in range(repeats):
+                sentences = [random_sentence(rng) for j in range(batch_size)]
+                start = time.perf_counter()
+                if batch_size == 1:
+                    getattr(va, method)(sentences[0])
+                else:
+                    classifier(sentences)
+                latencies.append(time.perf_counter() - start)
+            result = latency_percentiles(latencies)
+            result['sentences_per_second'] = round(batch_size * len(latencies) / sum(latencies), 1)
+            results[method][str(batch_size)] = result
+    return results
+
+# Function is used to time the loading and the filtering of a synthetic activity list made of copies of the real activities.
+def benchmark_activity(va, num_activities, repeats=1000, seed=0):
+    rng = random.Random(seed)
+    with open(f"""{va.cwd}/List_Of_Activity.csv""", "r", encoding='latin-1', newline='') as f:
+        rows = list(csv.DictReader(f))
+    with open(f"""{va.cwd}/List_Of_Activity.csv""", "w", encoding='latin-1', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        for i in range(num_activities):
+            row = dict(rng.choice(rows))
+            row['Activities'] = f"""{row['Activities']} ({i})"""
+            writer.writerow(row)
+    va.activity_index = None
+    start = time.perf_counter()
+    activity_index = va.load_activity_file()
+    load_seconds = time.perf_counter() - start
+    groups = [(row['Mood'].lower(), row['Indoor/Outdoor'].lower()) for row in rows]
+    session = ActivitySession(rng=random.Random(seed))
+    latencies = []
+    for i in range(repeats):
+        mood, place = groups[i % len(groups)]
+        start = time.perf_counter()
+        activity_index.sample(mood, place, session, k=2)
+        latencies.append(time.perf_counter() - start)
+    return {'activities': num_activities, 'load_seconds': round(load_seconds, 3), 'sample': latency_percentiles(latencies)}
+
+# Function is used to time the preprocessing of a synthetic TMDB export. About half of the plots are long enough to be summarized.
+def benchmark_preprocessing(work_dir, num_movies, seed=0):
+    rng = np.random.default_rng(seed)
+    overviews = []
+    for i in range(num_movies):
+        words = rng.choice(benchmark_words, int(rng.integers(8, 2 * movie_plot_treshold)))
+        overviews.append(f"""{' '.join(words[:8])}. {' '.join(words[8:])} {i}""")
+    export_path = f"""{work_dir}/benchmark_export.csv"""
+    pd.DataFrame({'id': np.arange(1, num_movies + 1), 'title': [f"""Movie {i}""" for i in range(1, num_movies + 1)], 'overview': overviews}).to_csv(export_path, index=False)
+    start = time.perf_counter()
+    # One worker, as the stand-in summarizer is only registered in this process.
+    df = load_movie_dataset(workers=1, export_path=export_path, cache_path=f"""{work_dir}/benchmark_summary_cache.jsonl""")
+    total_seconds = time.perf_counter() - start
+    return {
+        'rows': len(df),
+        'summarized': int((df['Length of overview'] > movie_plot_treshold).sum()),
+        'total_seconds': round(total_seconds, 3),
+        'rows_per_second': round(len(df) / total_seconds, 1),
+    }
+
+# Function is used to flatten the results into metric names such as search.5000.1_queries.p50_ms, which are the keys of a budget.
+def flatten_results(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten_results(value, f"""{prefix}{key}."""))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"""{prefix}{key}"""] = value
+    return flat
+
+# Function is used to compare the results with a budget of {"metric": {"max": value}} or {"metric": {"min": value}}. It returns the metrics out of budget. The metrics that were not run are skipped.
+def check_budget(results, budget):
+    flat = flatten_results(results)
+    failures = []
+    for name, limits in budget.items():
+        if name not in flat:
+            continue
+        if 'max' in limits and flat[name] > limits['max']:
+            failures.append(f"""{name} = {flat[name]} is above the budget of {limits['max']}""")
+        if 'min' in limits and flat[name] < limits['min']:
+            failures.append(f"""{name} = {flat[name]} is below the budget of {limits['min']}""")
+    return failures
+
+# Function is used to make a budget from the results with some headroom, so the next runs fail when they regress.
+def make_budget(results, headroom=2.0):
+    budget = {}
+    for name, value in flatten_results(results).items():
+        if name.endswith('max_ms') or name.endswith('p99_ms'):
+            # The slowest calls are too noisy to be tracked with a few repeats. They can be added to a budget by hand.
+            continue
+        floors = [floor for unit, floor in budget_floors.items() if name.endswith(unit)]
+        if floors:
+            budget[name] = {'max': round(max(value * headroom, floors[0]), 3)}
+        elif name.endswith('_per_second'):
+            budget[name] = {'min': round(value / headroom, 3)}
+    return budget
+
+# Function is used to run the benchmarks offline in a temporary working directory.
+def run_benchmarks(source_dir, names=benchmarks, sizes=benchmark_sizes, dimension=128, index_type=movie_index_type, num_queries=50, batch_sizes=benchmark_batch_sizes, repeats=20, num_activities=100000, num_movies=5000):
+    work_dir = tempfile.mkdtemp(prefix='va_benchmark_')
+    try:
+        for file_name in session_files:
+            if os.path.exists(f"""{source_dir}/{file_name}"""):
+                shutil.copy(f"""{source_dir}/{file_name}""", work_dir)
+        va = HeadlessAssistant([], work_dir)
+        results = {'config': {'dimension': dimension, 'index_type': index_type, 'models': registry.checkpoint('movie_encoder')}}
+        if 'search' in names:
+            results['search'] = benchmark_search(va, sizes, dimension, index_type, num_queries)
+        if 'classifiers' in names:
+            results['classifiers'] = benchmark_classifiers(va, batch_sizes, repeats)
+        if 'activity' in names:
+            results['activity'] = benchmark_activity(va, num_activities)
+        if 'preprocessing' in names:
+            results['preprocessing'] = benchmark_preprocessing(work_dir, num_movies)
+        results['peak_memory_mb'] = peak_memory_mb()
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the movie search, the classifiers, the activity filtering and the preprocessing offline, and check the results against a budget.')
+    parser.add_argument('--only', nargs='+', choices=benchmarks, default=benchmarks, help='Benchmarks to run.')
+    parser.add_argument('--sizes', nargs='+', type=int, default=benchmark_sizes, help='Number of movies of the synthetic catalogues.')
+    parser.add_argument('--dimension', type=int, default=128, help='Dimension of the synthetic embeddings (768 for the real encoder). Ignored with --pretrained-models.')
+    parser.add_argument('--index-type', choices=index_types, default=movie_index_type)
+    parser.add_argument('--queries', type=int, default=50, help='Number of searches per catalogue.')
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=benchmark_batch_sizes, help='Batch sizes of the classifiers.')
+    parser.add_argument('--repeats', type=int, default=20, help='Number of batches per classifier and batch size.')
+    parser.add_argument('--activities', type=int, default=100000, help='Number of activities of the synthetic activity list.')
+    parser.add_argument('--movies', type=int, default=5000, help='Number of movies of the synthetic TMDB export.')
+    parser.add_argument('--pretrained-models', action='store_true', help='Use the pre-trained models instead of the local stand-ins.')
+    parser.add_argument('--output', default=None, help='Write the results to this JSON file.')
+    parser.add_argument('--budget', default=None, help='Fail if a metric of this JSON budget regressed.')
+    parser.add_argument('--save-budget', default=None, help='Write a budget made from these results to this JSON file.')
+    parser.add_argument('--headroom', type=float, default=2.0, help='Headroom of the saved budget.')
+    args = parser.parse_args()
+
+    dimension = args.dimension
+    if args.pretrained_models:
+        registry.warm_up(background=False)
+        dimension = int(registry.get('movie_encoder').encode(['movie']).shape[1])
+    else:
+        register_stand_in_models(registry)
+        # The stand-in encoder has the dimension of the synthetic catalogues.
+        registry.register('movie_encoder', StandInEncoder(dimension), f"""stand-in/hashing-encoder-{dimension}""")
+    results = run_benchmarks(os.getcwd(), args.only, args.sizes, dimension, args.index_type, args.queries, args.batch_sizes, args.repeats, args.activities, args.movies)
+    print(json.dumps(results, indent=2))
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_budget is not None:
+        with open(args.save_budget, "w") as f:
+            json.dump(make_budget(results, args.headroom), f, indent=2)
+    if args.budget is not None:
+        with open(args.budget, "r") as f:
+            failures = check_budget(results, json.load(f))
+        if failures:
+            for failure in failures:
+                print(f"""Regression: {failure}""")
+            raise SystemExit(1)
+        print('Every metric is within the budget.')
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Apr 18 20:41:16 2024
+
+@author: jlkc1
+"""
+
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from VA_Project import VirtualAssistant, main, pygame
+
+# Class is used to run the speech output, the listening and the model inference of the Virtual Assistant on an asyncio event loop, so they can overlap.
+class ConversationEngine():
+
+    def __init__(self, va, workers=2, barge_in=False):
+        self.va = va
+        self.barge_in = barge_in
+        # Classifier and search calls run on the worker pool, speech synthesis and listening have their own thread so they are never queued behind a model.
+        self.worker_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='va-worker')
+        self.tts_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='va-tts')
+        self.listen_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='va-listen')
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.call(self.start())
+
+    # Function is used to create the playback queue and the player task on the event loop.
+    async def start(self):
+        self.playback_queue = asyncio.Queue()
+        self.current_sound_task = None
+        self.player_task = asyncio.create_task(self.player())
+
+    # Function is used to run a coroutine on the event loop from the thread of the conversation and wait for its result.
+    def call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    # Function is used to synthesize a sentence on the speech thread.
+    async def synthesize(self, text):
+        return await self.loop.run_in_executor(self.tts_pool, self.va.load_sound, text)
+
+    # Function is used to queue a sentence. Its synthesis starts right away, while the previous sentences are still playing.
+    async def speak(self, text):
+        sound_task = asyncio.create_task(self.synthesize(text))
+        await self.playback_queue.put(sound_task)
+
+    # Function is used to play the queued sentences one after the other.
+    async def player(self):
+        while True:
+            sound_task = await self.playback_queue.get()
+            self.current_sound_task = sound_task
+            try:
+                sound = await sound_task
+                channel = sound.play()
+                while channel is not None and channel.get_busy():
+                    await asyncio.sleep(0.02)
+            except asyncio.CancelledError:
+                # Only the sentence was cancelled by the user talking over it, the player goes on.
+                if not sound_task.cancelled():
+                    raise
+            except Exception as e:
+                self.va.va_print_without_audio(f"""Audio playback failed: {e}""")
+            finally:
+                self.current_sound_task = None
+                self.playback_queue.task_done()
+
+    # Function is used to wait until every queued sentence has been played.
+    async def wait_for_playback(self):
+        await self.playback_queue.join()
+
+    # Function is used to stop the current sentence and drop the queued ones when the user talks over the Virtual Assistant. A sentence still being synthesized is not played.
+    def stop_playback(self):
+        if self.current_sound_task is not None:
+            self.current_sound_task.cancel()
+        while not self.playback_queue.empty():
+            self.playback_queue.get_nowait().cancel()
+            self.playback_queue.task_done()
+        if pygame.mixer.get_init():
+            pygame.mixer.stop()
+
+    # Function is used to listen to the user. With barge-in, the microphone is opened while the Virtual Assistant is still talking, and it stops talking as soon as the user starts.
+    async def listen(self, param, msg_error):
+        on_speech_start = None
+        if self.barge_in:
+            on_speech_start = lambda: self.loop.call_soon_threadsafe(self.stop_playback)
+        else:
+            await self.wait_for_playback()
+        return await self.loop.run_in_executor(self.listen_pool, VirtualAssistant.speech_to_text, self.va, param, msg_error, on_speech_start)
+
+    # Function is used to run a classifier or a search on the worker pool.
+    async def run_model(self, function, *args):
+        return await self.loop.run_in_executor(self.worker_pool, function, *args)
+
+    # Function is used to stop the engine.
+    def close(self):
+        self.loop.call_soon_threadsafe(self.player_task.cancel)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        for pool in [self.worker_pool, self.tts_pool, self.listen_pool]:
+            pool.shutdown(wait=False)
+
+# Class is used to run the existing conversation of the Virtual Assistant on the conversation engine.
+class AsyncVirtualAssistant(VirtualAssistant):
+
+    def __init__(self, workers=2, barge_in=False):
+        super().__init__()
+        self.engine = ConversationEngine(self, workers=workers, barge_in=barge_in)
+
+    # Function is used to queue the speech of a sentence without waiting for it to be played.
+    def audio_play(self,text):
+        self.engine.call(self.engine.speak(text))
+
+    # Function is used to listen to the user once the Virtual Assistant is done talking, or right away with barge-in.
+    def speech_to_text(self,param,msg_error="Sorry, I didn't catch that. Can you please repeat?"):
+        return self.engine.call(self.engine.listen(param, msg_error))
+
+    # Function is used to wait for the wake up word once the Virtual Assistant is done talking, so it does not wake itself up with its own sign off.
+    def listen_for_wake_word(self):
+        self.engine.call(self.engine.wait_for_playback())
+        return super().listen_for_wake_word()
+
+    # Function is used to detect the emotion on the worker pool.
+    def emotion_detection(self,sentence):
+        return self.engine.call(self.engine.run_model(super().emotion_detection, sentence))
+
+    # Function is used to detect yes or no on the worker pool.
+    def yes_no_question(self,text):
+        return self.engine.call(self.engine.run_model(super().yes_no_question, text))
+
+    # Function is used to detect the sentiment on the worker pool.
+    def sentiment_detection(self,sentence):
+        return self.engine.call(self.engine.run_model(super().sentiment_detection, sentence))
+
+    # Function is used to search for a movie on the worker pool.
+    def movie_semantic_search(self,queries):
+        return self.engine.call(self.engine.run_model(super().movie_semantic_search, queries))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Virtual Assistant running on the asynchronous conversation engine.')
+    parser.add_argument('--workers', type=int, default=2, help='Number of threads running the classifiers and the movie search.')
+    parser.add_argument('--barge-in', action='store_true', help='Listen while the Virtual Assistant is talking (requires headphones or echo cancellation).')
+    args = parser.parse_args()
+
+    va = AsyncVirtualAssistant(workers=args.workers, barge_in=args.barge_in)
+    try:
+        main(va)
+    finally:
+        va.engine.close()
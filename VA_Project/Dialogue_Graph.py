@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed May  8 19:51:27 2024
+
+@author: jlkc1
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from Tracing import metrics
+
+# Class is used to describe one step of the conversation: what the Virtual Assistant does and what the next steps may need.
+class DialogueNode():
+
+    def __init__(self, name, run, prefetch=None):
+        self.name = name
+        # run(va, context) does the step and returns the name of the next step, or None at the end of the conversation.
+        self.run = run
+        # Tasks started while the step waits for the user, per possible next step. Each task is called as task(va, context, cancelled).
+        self.prefetch = prefetch or {}
+
+# Class is used to hold the steps of a conversation and the step it starts with.
+class DialogueGraph():
+
+    def __init__(self, nodes, start):
+        self.nodes = {node.name: node for node in nodes}
+        self.start = start
+        for node in nodes:
+            for next_name in node.prefetch:
+                if next_name not in self.nodes:
+                    raise ValueError(f"""The step {node.name} prefetches for the unknown step {next_name}""")
+
+# Class is used to run a dialogue graph. While a step waits for the user, the work of the possible next steps is started, and the work of the steps that were not taken is cancelled.
+class DialogueEngine():
+
+    def __init__(self, graph, workers=2):
+        self.graph = graph
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='va-prefetch')
+
+    # Function is used to run a speculative task. A failed task is ignored, the step does the work again when it needs it.
+    def run_task(self, task, va, context, cancelled):
+        if cancelled.is_set():
+            return
+        try:
+            task(va, context, cancelled)
+        except Exception:
+            pass
+
+    # Function is used to start the tasks of every possible next step of a step.
+    def start_prefetch(self, node, va, context):
+        branches = {}
+        for next_name, tasks in node.prefetch.items():
+            cancelled = threading.Event()
+            branches[next_name] = (cancelled, [self.pool.submit(self.run_task, task, va, context, cancelled) for task in tasks])
+        return branches
+
+    # Function is used to cancel the tasks of the steps that were not taken. Running tasks stop at their next check of the event.
+    def cancel_branches(self, branches, taken):
+        for next_name, (cancelled, futures) in branches.items():
+            if next_name == taken:
+                metrics.increment('prefetch_tasks_total', len(futures), outcome='used')
+                continue
+            cancelled.set()
+            for future in futures:
+                future.cancel()
+            metrics.increment('prefetch_tasks_total', len(futures), outcome='cancelled')
+
+    # Function is used to run the conversation from the first step until a step ends it.
+    def run(self, va, context):
+        name = self.graph.start
+        while name is not None:
+            node = self.graph.nodes[name]
+            branches = self.start_prefetch(node, va, context)
+            name = None
+            try:
+                name = node.run(va, context)
+            finally:
+                self.cancel_branches(branches, name)
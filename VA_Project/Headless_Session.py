@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Apr 20 15:27:48 2024
+
+@author: jlkc1
+"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from VA_Project import VirtualAssistant, main
+from Model_Registry import registry
+from Stand_In_Models import register_stand_in_models
+from Query_Cache import query_cache
+from Tracing import tracer, metrics
+from Movie_Index import movie_index_files
+from Movie_Store import movie_store_files
+
+# Files the Virtual Assistant reads from its working directory. They are copied so a scripted session never changes the real ones.
+session_files = ['Greet_Question.txt', 'New_User_Question.txt', 'Mood_Question.xlsx', 'List_Of_Activity.csv', 'User_Preference_Movie.txt']
+
+# Weather API responses returned by the stand-in weather backend.
+stand_in_weather = {
+    'indoor': {'name': 'Headless City', 'main': {'temp': 12}, 'weather': [{'id': 500}]},
+    'outdoor': {'name': 'Headless City', 'main': {'temp': 24}, 'weather': [{'id': 800}]},
+    'unavailable': None,
+}
+
+# Class is used to signal that every line of a transcript has been said.
+class EndOfTranscript(Exception):
+    pass
+
+# Function is used to load a transcript. Each line is something the user says, lines starting with # are comments.
+def load_transcript(path):
+    with open(path, "r", encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+
+# Class is used as a stand-in for the weather provider. It returns a fixed weather without network.
+class StandInWeatherProvider():
+
+    def __init__(self, weather):
+        self.weather = weather
+
+    def prefetch(self):
+        return None
+
+    def get_weather(self):
+        return self.weather
+
+# Class is used to run the Virtual Assistant from a transcript, without microphone, speech recognition, speech synthesis or weather API.
+class HeadlessAssistant(VirtualAssistant):
+
+    def __init__(self, transcript, session_dir, weather='outdoor'):
+        super().__init__()
+        self.cwd = session_dir
+        self.transcript = list(transcript)
+        self.weather_provider = StandInWeatherProvider(stand_in_weather[weather])
+        self.spoken = []
+        self.turn_latencies = []
+        self.turn_start = None
+
+    # Function is used to replay the next line of the transcript. The time since the previous line is the latency of the turn.
+    def speech_to_text(self,param,msg_error="Sorry, I didn't catch that. Can you please repeat?"):
+        if self.turn_start is not None:
+            self.turn_latencies.append(time.perf_counter() - self.turn_start)
+        if not self.transcript:
+            raise EndOfTranscript()
+        self.va_print_without_audio('Listening...')
+        text = self.transcript.pop(0)
+        self.turn_start = time.perf_counter()
+        return text
+
+    # Function is used to read the wake up word from the transcript instead of the microphone.
+    def listen_for_wake_word(self):
+        return self.speech_to_text(param=False)
+
+    # Function is used to record what the Virtual Assistant says instead of playing it.
+    def audio_play(self,text):
+        self.spoken.append(text)
+
+    # Function is used to skip the audio of the next sentences, as nothing is played.
+    def prefetch_audio(self,text):
+        pass
+
+# Function is used to create the working directory of a session with a copy of the data files.
+def prepare_session_dir(source_dir, movie_dataset):
+    session_dir = tempfile.mkdtemp(prefix='va_session_')
+    for file_name in session_files:
+        if os.path.exists(f"""{source_dir}/{file_name}"""):
+            shutil.copy(f"""{source_dir}/{file_name}""", session_dir)
+    shutil.copy(movie_dataset, f"""{session_dir}/preprocessed_movie_dataset.csv""")
+    return session_dir
+
+# Function is used to run one transcript from the wake up word to the sign off and return its timings.
+def run_session(transcript_path, source_dir, movie_dataset, weather, index_dir=None):
+    session_dir = prepare_session_dir(source_dir, movie_dataset)
+    if index_dir is not None:
+        for file_name in movie_index_files + movie_store_files:
+            if os.path.exists(f"""{index_dir}/{file_name}"""):
+                shutil.copy(f"""{index_dir}/{file_name}""", session_dir)
+    va = HeadlessAssistant(load_transcript(transcript_path), session_dir, weather)
+    start = time.perf_counter()
+    try:
+        main(va)
+    except EndOfTranscript:
+        pass
+    session_seconds = time.perf_counter() - start
+    shutil.rmtree(session_dir, ignore_errors=True)
+    return {
+        'transcript': os.path.basename(transcript_path),
+        'turns': len(va.turn_latencies),
+        'session_seconds': session_seconds,
+        'turn_latencies': va.turn_latencies,
+        'spoken': va.spoken,
+    }
+
+# Function is used to summarize a list of latencies with percentiles, in milliseconds.
+def latency_percentiles(latencies):
+    if not latencies:
+        return {}
+    values = np.array(latencies) * 1000
+    return {
+        'count': len(values),
+        'p50_ms': round(float(np.percentile(values, 50)), 2),
+        'p90_ms': round(float(np.percentile(values, 90)), 2),
+        'p99_ms': round(float(np.percentile(values, 99)), 2),
+        'max_ms': round(float(values.max()), 2),
+    }
+
+if __name__ == "__main__":
+    cwd = os.getcwd()
+    parser = argparse.ArgumentParser(description='Run scripted sessions of the Virtual Assistant offline and report their latency.')
+    parser.add_argument('transcripts', nargs='+', help='Transcript files, one user sentence per line.')
+    parser.add_argument('--movie-dataset', default=f"""{cwd}/preprocessed_movie_dataset.csv""", help='Preprocessed movie dataset used by the movie search.')
+    parser.add_argument('--weather', choices=list(stand_in_weather), default='outdoor')
+    parser.add_argument('--stand-in-models', action='store_true', help='Use local lexicon classifiers and a hashing encoder instead of the pre-trained models.')
+    parser.add_argument('--repeat', type=int, default=1, help='Number of times each transcript is replayed.')
+    parser.add_argument('--output', default=None, help='Write the report to this JSON file.')
+    parser.add_argument('--trace-file', default=None, help='Trace every turn and save the spans to this JSON file.')
+    args = parser.parse_args()
+
+    if args.trace_file is not None:
+        tracer.sample_rate = 1
+    if args.stand_in_models:
+        register_stand_in_models(registry)
+    else:
+        registry.warm_up(background=False)
+    # The movie index and the movie store are built once and shared by every session.
+    index_dir = tempfile.mkdtemp(prefix='va_index_')
+    warm_up = HeadlessAssistant([], prepare_session_dir(cwd, args.movie_dataset))
+    warm_up.load_movie_index()
+    warm_up.load_movie_store()
+    for file_name in movie_index_files + movie_store_files:
+        shutil.copy(f"""{warm_up.cwd}/{file_name}""", index_dir)
+    shutil.rmtree(warm_up.cwd, ignore_errors=True)
+
+    sessions = []
+    for i in range(args.repeat):
+        for transcript_path in args.transcripts:
+            sessions.append(run_session(transcript_path, cwd, args.movie_dataset, args.weather, index_dir))
+    shutil.rmtree(index_dir, ignore_errors=True)
+
+    report = {
+        'sessions': len(sessions),
+        'turn_latency': latency_percentiles([latency for session in sessions for latency in session['turn_latencies']]),
+        'session_latency': latency_percentiles([session['session_seconds'] for session in sessions]),
+        'query_cache': query_cache.get_stats(),
+        'per_transcript': {},
+    }
+    for transcript_path in args.transcripts:
+        name = os.path.basename(transcript_path)
+        runs = [session for session in sessions if session['transcript'] == name]
+        report['per_transcript'][name] = {
+            'turns': runs[0]['turns'],
+            'turn_latency': latency_percentiles([latency for session in runs for latency in session['turn_latencies']]),
+            'session_latency': latency_percentiles([session['session_seconds'] for session in runs]),
+        }
+    print(json.dumps(report, indent=2))
+    if args.trace_file is not None:
+        tracer.export(args.trace_file)
+        print(metrics.prometheus_text())
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri May  3 18:12:46 2024
+
+@author: jlkc1
+"""
+
+import time
+import importlib
+import threading
+
+# Time at which the first module of the Virtual Assistant was imported, used to report how long the start took.
+startup_time = time.perf_counter()
+
+# Seconds spent importing each heavy module, in the order they were imported.
+import_timings = {}
+
+# Class is used to import a heavy module on the first use of one of its attributes, so the start of the Virtual Assistant does not wait for it.
+class LazyModule():
+
+    def __init__(self, name, on_import=None):
+        self.__dict__['name'] = name
+        self.__dict__['on_import'] = on_import
+        self.__dict__['module'] = None
+        # Each module has its own lock, so importing one heavy module does not block the first use of another one.
+        self.__dict__['lock'] = threading.RLock()
+
+    # Function is used to import the module once and record how long it took.
+    def load(self):
+        module = self.__dict__['module']
+        if module is not None:
+            return module
+        with self.__dict__['lock']:
+            if self.__dict__['module'] is None:
+                start = time.perf_counter()
+                module = importlib.import_module(self.__dict__['name'])
+                if self.__dict__['on_import'] is not None:
+                    self.__dict__['on_import'](module)
+                import_timings[self.__dict__['name']] = round(time.perf_counter() - start, 3)
+                self.__dict__['module'] = module
+            return self.__dict__['module']
+
+    def __getattr__(self, attribute):
+        return getattr(self.load(), attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(self.load(), attribute, value)
+
+# Function is used to get a module that is only imported on first use.
+def lazy_import(name, on_import=None):
+    return LazyModule(name, on_import)
+
+# Function is used to check if a lazy module was imported, without importing it.
+def is_imported(module):
+    return not isinstance(module, LazyModule) or module.__dict__['module'] is not None
+
+# Function is used to report the seconds since the start and the time spent importing each heavy module.
+def startup_report():
+    return {
+        'seconds_since_start': round(time.perf_counter() - startup_time, 3),
+        'imports': dict(import_timings),
+    }
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Apr 14 16:38:52 2024
+
+@author: jlkc1
+"""
+
+import os
+import time
+import threading
+from Lazy_Import import lazy_import, is_imported
+from Tracing import metrics
+
+# torch, transformers and sentence_transformers take seconds to import, so they are imported when the first model is loaded.
+torch = lazy_import('torch')
+transformers = lazy_import('transformers')
+sentence_transformers = lazy_import('sentence_transformers')
+
+movie_model_name = 'msmarco-distilbert-base-dot-prod-v3'
+
+# Task, checkpoint and extra pipeline arguments of every model used by the Virtual Assistant.
+model_specs = {
+    'emotion': ('text-classification', 'j-hartmann/emotion-english-distilroberta-base', {'top_k': 1}),
+    'yes_no': ('text-classification', 'manohar899/bert_yes_no', {'top_k': 1}),
+    'sentiment': ('text-classification', 'distilbert/distilbert-base-uncased-finetuned-sst-2-english', {}),
+    'summarization': ('summarization', 'facebook/bart-large-cnn', {}),
+    'movie_encoder': ('sentence-embedding', movie_model_name, {}),
+}
+
+# Models that can be served by the quantized ONNX Runtime backend (see Onnx_Backend.py).
+onnx_models = ['emotion', 'yes_no', 'sentiment', 'movie_encoder']
+
+# Models that are needed during a conversation and are loaded by the warm-up after the wake word.
+conversation_models = ['emotion', 'yes_no', 'sentiment', 'movie_encoder']
+
+# Class is used to load every model once per process and share it between the callers.
+class ModelRegistry():
+
+    def __init__(self, num_threads=None, backend=None, onnx_model_dir=None):
+        self.models = {}
+        self.tokenizers = {}
+        self.stats = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+        self.warm_up_thread = None
+        # The device is chosen when the first model is loaded, so creating the registry does not import torch.
+        self.device = None
+        # 'pytorch' runs the fp32 models, 'onnx' runs the int8 ONNX exports on CPU.
+        self.backend = backend if backend is not None else os.environ.get('VA_BACKEND', 'pytorch')
+        self.onnx_model_dir = onnx_model_dir if onnx_model_dir is not None else f"""{os.getcwd()}/onnx_models"""
+        self.set_num_threads(num_threads)
+
+    # Function is used to set the number of threads torch uses for inference. It is applied when torch is imported.
+    def set_num_threads(self, num_threads=None):
+        if num_threads is None:
+            num_threads = int(os.environ.get('VA_TORCH_THREADS', os.cpu_count() or 1))
+        self.num_threads = num_threads
+        if is_imported(torch):
+            torch.set_num_threads(num_threads)
+
+    # Function is used to import torch, apply the number of threads and choose the device.
+    def get_device(self):
+        if self.device is None:
+            torch.set_num_threads(self.num_threads)
+            self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        return self.device
+
+    # Function is used to get the lock of a model, so two threads never load the same model twice.
+    def model_lock(self, name):
+        with self.lock:
+            if name not in self.locks:
+                self.locks[name] = threading.Lock()
+            return self.locks[name]
+
+    # Function is used to get a tokenizer. Tokenizers are shared between the models built from the same checkpoint.
+    def get_tokenizer(self, checkpoint):
+        with self.model_lock(('tokenizer', checkpoint)):
+            if checkpoint not in self.tokenizers:
+                self.tokenizers[checkpoint] = transformers.AutoTokenizer.from_pretrained(checkpoint)
+            return self.tokenizers[checkpoint]
+
+    # Function is used to get a model. The model is loaded on first use and reused afterwards.
+    def get(self, name):
+        model = self.models.get(name)
+        if model is not None:
+            return model
+        with self.model_lock(name):
+            if name not in self.models:
+                self.models[name] = self.load(name)
+            return self.models[name]
+
+    # Function is used to register an already loaded model, e.g. a local stand-in used without network.
+    def register(self, name, model, checkpoint):
+        with self.model_lock(name):
+            self.models[name] = model
+            self.stats[name] = {'checkpoint': checkpoint, 'device': 'cpu', 'load_seconds': 0.0, 'parameter_bytes': 0}
+
+    # Function is used to get the checkpoint a model was loaded from.
+    def checkpoint(self, name):
+        if name in self.stats:
+            return self.stats[name]['checkpoint']
+        return model_specs[name][1]
+
+    # Function is used to load a model and record its load time and memory footprint.
+    def load(self, name):
+        task, checkpoint, kwargs = model_specs[name]
+        start = time.perf_counter()
+        metrics.increment('model_loads_total', model=name, backend=self.backend)
+        if self.backend == 'onnx' and name in onnx_models:
+            # Imported here so onnxruntime and optimum are only needed by the ONNX backend.
+            from Onnx_Backend import load_onnx_model
+            model, model_bytes = load_onnx_model(name, self.onnx_model_dir)
+            self.stats[name] = {
+                'checkpoint': checkpoint,
+                'device': 'cpu',
+                'backend': 'onnx',
+                'load_seconds': round(time.perf_counter() - start, 3),
+                'parameter_bytes': model_bytes,
+            }
+            return model
+        device = self.get_device()
+        if task == 'sentence-embedding':
+            model = sentence_transformers.SentenceTransformer(checkpoint, device=device)
+            parameters = model.parameters()
+        else:
+            model = transformers.pipeline(task, model=checkpoint, tokenizer=self.get_tokenizer(checkpoint), device=device, **kwargs)
+            parameters = model.model.parameters()
+        self.stats[name] = {
+            'checkpoint': checkpoint,
+            'device': device,
+            'backend': 'pytorch',
+            'load_seconds': round(time.perf_counter() - start, 3),
+            'parameter_bytes': sum(p.numel() * p.element_size() for p in parameters),
+        }
+        return model
+
+    # Function is used to load the models in the background, so the first turn does not wait for them.
+    def warm_up(self, names=None, background=True):
+        names = conversation_models if names is None else names
+        if not background:
+            for name in names:
+                self.get(name)
+            return None
+        if self.warm_up_thread is None or not self.warm_up_thread.is_alive():
+            self.warm_up_thread = threading.Thread(target=self.warm_up, args=(names, False), daemon=True)
+            self.warm_up_thread.start()
+        return self.warm_up_thread
+
+    # Function is used to report the load time and memory of every loaded model.
+    def get_stats(self):
+        return {
+            'device': self.device,
+            'backend': self.backend,
+            'num_threads': self.num_threads,
+            'models': dict(self.stats),
+            'total_parameter_bytes': sum(stat['parameter_bytes'] for stat in self.stats.values()),
+        }
+
+# Registry shared by the whole process.
+registry = ModelRegistry()
+
+if __name__ == "__main__":
+    registry.warm_up(background=False)
+    for name, stat in registry.get_stats()["models"].items():
+        print(f"""{name}: {stat['load_seconds']}s, {stat['parameter_bytes'] / 1e6:.1f} MB on {stat['device']}""")
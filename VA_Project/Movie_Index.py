@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Apr 13 10:02:37 2024
+
+@author: jlkc1
+"""
+
+import numpy as np
+import os
+import json
+import time
+import math
+import hashlib
+import shutil
+import argparse
+import tempfile
+from Lazy_Import import lazy_import
+from Model_Registry import registry, movie_model_name
+
+# Imported on first use, so the Virtual Assistant can listen before they are loaded.
+pd = lazy_import('pandas')
+faiss = lazy_import('faiss')
+sentence_transformers = lazy_import('sentence_transformers')
+
+movie_index_file = 'movie_plot.index'
+movie_embedding_file = 'movie_embeddings.npy'
+movie_id_file = 'movie_ids.npy'
+movie_index_meta_file = 'movie_index_meta.json'
+movie_index_files = [movie_index_file, movie_embedding_file, movie_id_file, movie_index_meta_file]
+movie_index_type = os.environ.get('VA_MOVIE_INDEX', 'flat')
+cwd = os.getcwd()
+
+# Index types that can be built. The flat index is exact, the others are approximate and scale to millions of movies.
+index_types = ['flat', 'ivf_flat', 'ivf_pq', 'hnsw']
+
+# Class is used to hold the memory-mapped movie index, the embedding matrix, the TMDB id of each row and the information it was built from.
+class MovieIndex():
+
+    def __init__(self, index, embeddings, meta, ids=None):
+        self.index = index
+        self.embeddings = embeddings
+        self.meta = meta
+        self.ids = ids
+
+# Function is used to get the TMDB ids of the movies. They are the ids of the index, so a movie keeps its id when the catalogue changes.
+def movie_ids(df):
+    return df['id'].to_numpy(dtype='int64')
+
+# Function is used to compute a content hash of the preprocessed movie dataset, so a saved index can be matched to it.
+def dataset_hash(dataset_path):
+    sha = hashlib.sha256()
+    with open(dataset_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+# Function is used to get a fingerprint of a loaded index. It changes when the index is rebuilt from another dataset, model or index type.
+def index_fingerprint(meta):
+    return hashlib.sha256(json.dumps([meta.get('dataset_hash'), meta.get('model_name'), meta.get('num_movies'), meta.get('index')], sort_keys=True).encode('utf-8')).hexdigest()
+
+# Function is used to get the parameters of an index type. The defaults depend on the number of movies.
+def index_parameters(index_type, num_vectors, dimension, nlist=None, pq_m=None, hnsw_m=32, nprobe=None, ef_search=None):
+    params = {'index_type': index_type}
+    if index_type in ['ivf_flat', 'ivf_pq']:
+        # FAISS needs about 39 training vectors per list.
+        params['nlist'] = nlist if nlist is not None else max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+        params['nprobe'] = nprobe if nprobe is not None else max(1, params['nlist'] // 16)
+    if index_type == 'ivf_pq':
+        # About 8 dimensions per sub-quantizer, at most 32, so the codes stay small and the training stays fast. The number of sub-quantizers must divide the dimension.
+        pq_m = pq_m if pq_m is not None else max(1, min(32, dimension // 8))
+        params['pq_m'] = max(m for m in range(1, pq_m + 1) if dimension % m == 0)
+        # 8 bits per code needs 256 centroids per sub-quantizer, so small catalogues use fewer bits.
+        params['pq_bits'] = max(1, min(8, int(math.log2(max(2, num_vectors // 39)))))
+    if index_type == 'hnsw':
+        params['hnsw_m'] = hnsw_m
+        params['ef_search'] = ef_search if ef_search is not None else 64
+    return params
+
+# Function is used to get the FAISS factory string of an index.
+def index_factory_string(params):
+    if params['index_type'] == 'flat':
+        return 'IDMap,Flat'
+    if params['index_type'] == 'ivf_flat':
+        return f"""IVF{params['nlist']},Flat"""
+    if params['index_type'] == 'ivf_pq':
+        return f"""IVF{params['nlist']},PQ{params['pq_m']}x{params['pq_bits']}"""
+    if params['index_type'] == 'hnsw':
+        return f"""IDMap,HNSW{params['hnsw_m']},Flat"""
+    raise ValueError(f"""Unknown index type {params['index_type']}, expected one of {index_types}""")
+
+# Function is used to set the search parameters of an approximate index (number of probed lists or HNSW search depth).
+def set_search_parameters(index, params):
+    parameter_space = faiss.ParameterSpace()
+    if 'nprobe' in params:
+        parameter_space.set_index_parameter(index, 'nprobe', params['nprobe'])
+    if 'ef_search' in params:
+        parameter_space.set_index_parameter(index, 'efSearch', params['ef_search'])
+
+# Function is used to create an index of the embeddings. Approximate indexes are trained on a random sample.
+def create_index(embeddings, ids, params, train_size=None, seed=0):
+    index = faiss.index_factory(embeddings.shape[1], index_factory_string(params), faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        if train_size is None:
+            train_size = max(64 * params.get('nlist', 1), 256 * 39)
+        sample = np.random.default_rng(seed).choice(len(embeddings), min(train_size, len(embeddings)), replace=False)
+        index.train(np.ascontiguousarray(embeddings[np.sort(sample)], dtype='float32'))
+    # The vectors are added in chunks, so a memory-mapped embedding matrix is never fully copied.
+    for start in range(0, len(embeddings), 100000):
+        chunk = np.ascontiguousarray(embeddings[start:start + 100000], dtype='float32')
+        index.add_with_ids(chunk, ids[start:start + 100000])
+    set_search_parameters(index, params)
+    return index
+
+# Function is used to write a file through a temporary file, so an interrupted run never leaves a half written file.
+def write_atomically(path, write):
+    temp_path = f"""{path}.tmp"""
+    write(temp_path)
+    os.replace(temp_path, path)
+
+# Function is used to get a writer of an array for write_atomically. The array is saved to an open file, so numpy does not add its own extension to the temporary file.
+def save_array(array):
+    def write(path):
+        with open(path, "wb") as f:
+            np.save(f, array)
+    return write
+
+# Function is used to save the FAISS index, the embedding matrix and the TMDB ids. The metadata is saved last, so the files are only used once they all match.
+def save_movie_index(index_dir, index, embeddings, ids, meta):
+    def save_meta(path):
+        with open(path, "w") as f:
+            json.dump(meta, f, indent=2)
+    write_atomically(f"""{index_dir}/{movie_index_file}""", lambda path: faiss.write_index(index, path))
+    write_atomically(f"""{index_dir}/{movie_embedding_file}""", save_array(embeddings))
+    write_atomically(f"""{index_dir}/{movie_id_file}""", save_array(ids))
+    write_atomically(f"""{index_dir}/{movie_index_meta_file}""", save_meta)
+
+# Function is used to get the encoder of the movie plots.
+def movie_encoder(model_name):
+    return registry.get('movie_encoder') if model_name == movie_model_name else sentence_transformers.SentenceTransformer(model_name)
+
+# Function is used to encode every movie plot once and save the FAISS index, the embedding matrix and its metadata. The index is keyed by the TMDB id.
+def build_movie_index(dataset_path=f"""{cwd}/preprocessed_movie_dataset.csv""", index_dir=cwd, model_name=movie_model_name, model=None, index_type=movie_index_type, **index_options):
+    df = pd.read_csv(dataset_path, memory_map=True)
+    if model is None:
+        model = movie_encoder(model_name)
+    encoded_data = model.encode(df['summarization'].tolist(), batch_size=64, show_progress_bar=True)
+    encoded_data = np.ascontiguousarray(encoded_data, dtype='float32')
+    ids = movie_ids(df)
+    params = index_parameters(index_type, len(df), encoded_data.shape[1], **index_options)
+    index = create_index(encoded_data, ids, params)
+    meta = {
+        'dataset_hash': dataset_hash(dataset_path),
+        'model_name': model_name,
+        'num_movies': len(df),
+        'dimension': int(encoded_data.shape[1]),
+        'index': params,
+    }
+    save_movie_index(index_dir, index, encoded_data, ids, meta)
+    return meta
+
+# Function is used to update the saved index after the catalogue changed. Only the added or changed movies are encoded, the embeddings of the other movies are reused and the deleted movies are removed.
+def update_movie_index(dataset_path=f"""{cwd}/preprocessed_movie_dataset.csv""", index_dir=cwd, model_name=movie_model_name, model=None, changed_ids=None):
+    meta_path = f"""{index_dir}/{movie_index_meta_file}"""
+    if not all(os.path.exists(f"""{index_dir}/{file_name}""") for file_name in movie_index_files):
+        return build_movie_index(dataset_path, index_dir, model_name, model)
+    with open(meta_path, "r") as f:
+        meta = json.load(f)
+    params = meta.get('index', {'index_type': 'flat'})
+    if meta.get('model_name') != model_name:
+        # The index is rebuilt for the new model with the parameters of the saved index.
+        index_options = {key: params[key] for key in ['nlist', 'pq_m', 'hnsw_m', 'nprobe', 'ef_search'] if key in params}
+        return build_movie_index(dataset_path, index_dir, model_name, model, params['index_type'], **index_options)
+    df = pd.read_csv(dataset_path, memory_map=True)
+    ids = movie_ids(df)
+    old_ids = np.load(f"""{index_dir}/{movie_id_file}""")
+    old_embeddings = np.load(f"""{index_dir}/{movie_embedding_file}""", mmap_mode='r')
+    old_rows = pd.Series(np.arange(len(old_ids)), index=old_ids)
+    changed_ids = np.asarray(sorted(changed_ids or []), dtype='int64')
+    reused = np.isin(ids, old_ids) & ~np.isin(ids, changed_ids)
+    embeddings = np.empty((len(ids), meta['dimension']), dtype='float32')
+    embeddings[reused] = old_embeddings[old_rows.loc[ids[reused]].to_numpy()]
+    encoded_rows = np.flatnonzero(~reused)
+    if len(encoded_rows):
+        if model is None:
+            model = movie_encoder(model_name)
+        embeddings[encoded_rows] = model.encode(df['summarization'].iloc[encoded_rows].tolist(), batch_size=64)
+    # The deleted movies and the old version of the changed movies are removed from the index.
+    removed_ids = np.setdiff1d(old_ids, ids[reused])
+    if params['index_type'] == 'hnsw':
+        # HNSW graphs do not support removal, so the graph is rebuilt from the embeddings without encoding them again.
+        index = create_index(embeddings, ids, params)
+    else:
+        index = faiss.read_index(f"""{index_dir}/{movie_index_file}""")
+        if len(removed_ids):
+            index.remove_ids(removed_ids)
+        if len(encoded_rows):
+            index.add_with_ids(embeddings[encoded_rows], ids[encoded_rows])
+        set_search_parameters(index, params)
+    del old_embeddings
+    meta['dataset_hash'] = dataset_hash(dataset_path)
+    meta['num_movies'] = len(df)
+    meta['last_update'] = {
+        'encoded': int(len(encoded_rows)),
+        'removed': int(len(np.setdiff1d(old_ids, ids))),
+        'reused': int(reused.sum()),
+    }
+    save_movie_index(index_dir, index, embeddings, ids, meta)
+    return meta
+
+# Function is used to memory-map the saved index and embedding matrix. None is returned if they are missing or were built from another dataset or model.
+def load_movie_index(dataset_path=f"""{cwd}/preprocessed_movie_dataset.csv""", index_dir=cwd, model_name=movie_model_name, nprobe=None, ef_search=None):
+    meta_path = f"""{index_dir}/{movie_index_meta_file}"""
+    index_path = f"""{index_dir}/{movie_index_file}"""
+    embedding_path = f"""{index_dir}/{movie_embedding_file}"""
+    id_path = f"""{index_dir}/{movie_id_file}"""
+    if not (os.path.exists(meta_path) and os.path.exists(index_path) and os.path.exists(embedding_path) and os.path.exists(id_path)):
+        return None
+    with open(meta_path, "r") as f:
+        meta = json.load(f)
+    if meta.get('model_name') != model_name or meta.get('dataset_hash') != dataset_hash(dataset_path):
+        return None
+    index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    embeddings = np.load(embedding_path, mmap_mode='r')
+    ids = np.load(id_path, mmap_mode='r')
+    if index.ntotal != meta['num_movies'] or embeddings.shape[0] != meta['num_movies'] or ids.shape[0] != meta['num_movies']:
+        return None
+    # The search parameters saved with the index can be tuned without rebuilding it.
+    params = dict(meta.get('index', {'index_type': 'flat'}))
+    if nprobe is not None and 'nprobe' in params:
+        params['nprobe'] = nprobe
+    if ef_search is not None and 'ef_search' in params:
+        params['ef_search'] = ef_search
+    set_search_parameters(index, params)
+    meta['index'] = params
+    return MovieIndex(index, embeddings, meta, ids)
+
+# Function is used to create a catalogue of the requested size from the real embeddings, by adding noise to copies of them.
+def scale_embeddings(embeddings, size, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(embeddings), size)
+    scaled = np.asarray(embeddings[np.sort(rows)], dtype='float32')
+    scaled += rng.normal(0, 0.05 * float(np.std(scaled)), scaled.shape).astype('float32')
+    return scaled
+
+# Function is used to compare the recall and the latency of approximate indexes with the exact flat index.
+def recall_latency_report(embeddings, configurations, top_k=10, num_queries=200, seed=0, index_dir=None):
+    rng = np.random.default_rng(seed)
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    ids = np.arange(len(embeddings), dtype='int64')
+    queries = embeddings[rng.choice(len(embeddings), min(num_queries, len(embeddings)), replace=False)]
+    queries = queries + rng.normal(0, 0.1 * float(np.std(queries)), queries.shape).astype('float32')
+    exact = create_index(embeddings, ids, {'index_type': 'flat'})
+    ground_truth = exact.search(queries, top_k)[1]
+    report = []
+    for configuration in configurations:
+        params = index_parameters(configuration['index_type'], len(embeddings), embeddings.shape[1], **{k: v for k, v in configuration.items() if k != 'index_type'})
+        start = time.perf_counter()
+        index = create_index(embeddings, ids, params)
+        build_seconds = time.perf_counter() - start
+        if index_dir is not None:
+            # The index is searched from disk, as it is at runtime.
+            faiss.write_index(index, f"""{index_dir}/report.index""")
+            index = faiss.read_index(f"""{index_dir}/report.index""", faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            set_search_parameters(index, params)
+        latencies = []
+        found = np.empty_like(ground_truth)
+        for i in range(len(queries)):
+            start = time.perf_counter()
+            found[i] = index.search(queries[i:i + 1], top_k)[1][0]
+            latencies.append((time.perf_counter() - start) * 1000)
+        recall = np.mean([len(set(found[i]) & set(ground_truth[i])) / top_k for i in range(len(queries))])
+        report.append({
+            'index': params,
+            'factory': index_factory_string(params),
+            f"""recall@{top_k}""": round(float(recall), 4),
+            'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+            'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+            'build_seconds': round(build_seconds, 2),
+        })
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build the movie index, or report the recall and latency of the index types.')
+    parser.add_argument('--index-type', choices=index_types, default=movie_index_type)
+    parser.add_argument('--nlist', type=int, default=None, help='Number of inverted lists of the IVF indexes.')
+    parser.add_argument('--pq-m', type=int, default=None, help='Number of sub-quantizers of the IVF-PQ index.')
+    parser.add_argument('--hnsw-m', type=int, default=32, help='Number of neighbours per node of the HNSW index.')
+    parser.add_argument('--nprobe', type=int, default=None, help='Number of inverted lists probed per query.')
+    parser.add_argument('--ef-search', type=int, default=None, help='Search depth of the HNSW index.')
+    parser.add_argument('--report', action='store_true', help='Compare every index type with the flat index instead of building the index.')
+    parser.add_argument('--size', type=int, default=None, help='Number of movies of the catalogue used by the report (scaled from the real embeddings).')
+    parser.add_argument('--top-k', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.report:
+        embeddings = np.load(f"""{cwd}/{movie_embedding_file}""", mmap_mode='r')
+        if args.size is not None:
+            embeddings = scale_embeddings(embeddings, args.size)
+        configurations = [{'index_type': 'flat'}]
+        configurations += [{'index_type': 'ivf_flat', 'nlist': args.nlist, 'nprobe': nprobe} for nprobe in [1, 4, 16, 64]]
+        configurations += [{'index_type': 'ivf_pq', 'nlist': args.nlist, 'pq_m': args.pq_m, 'nprobe': nprobe} for nprobe in [4, 16, 64]]
+        configurations += [{'index_type': 'hnsw', 'hnsw_m': args.hnsw_m, 'ef_search': ef_search} for ef_search in [16, 64, 256]]
+        report_dir = tempfile.mkdtemp(prefix='va_index_report_')
+        for row in recall_latency_report(embeddings, configurations, top_k=args.top_k, index_dir=report_dir):
+            print(json.dumps(row))
+        shutil.rmtree(report_dir, ignore_errors=True)
+    else:
+        meta = build_movie_index(index_type=args.index_type, nlist=args.nlist, pq_m=args.pq_m, hnsw_m=args.hnsw_m, nprobe=args.nprobe, ef_search=args.ef_search)
+        print(f"""Indexed {meta['num_movies']} movies with {meta['model_name']} ({meta['index']['index_type']})""")
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon May  6 20:16:33 2024
+
+@author: jlkc1
+"""
+
+import os
+import json
+import numpy as np
+from Movie_Index import dataset_hash, write_atomically, save_array
+
+movie_store_columns = ['title', 'summarization']
+movie_store_meta_file = 'movie_store.json'
+movie_store_id_file = 'movie_store_ids.npy'
+movie_store_lookup_file = 'movie_store_lookup.npy'
+movie_store_offset_file = 'movie_store_offsets.npy'
+movie_store_string_file = 'movie_store_strings.bin'
+movie_store_files = [movie_store_id_file, movie_store_lookup_file, movie_store_offset_file, movie_store_string_file, movie_store_meta_file]
+cwd = os.getcwd()
+
+# Class is used to read the columns used at runtime from a memory-mapped string table. Row i is the movie of row i of the embedding matrix.
+class MovieStore():
+
+    def __init__(self, ids, lookup, offsets, strings, meta):
+        self.ids = ids
+        # Sorted ids and their rows, so a movie is found by binary search without building a dictionary.
+        self.lookup = lookup
+        # Start of every value of each column in the strings, with the end of the last value.
+        self.offsets = offsets
+        self.strings = strings
+        self.meta = meta
+        self.columns = meta['columns']
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Function is used to get the row of a movie. None is returned if the id is unknown.
+    def row(self, movie_id):
+        position = int(np.searchsorted(self.lookup[0], movie_id))
+        if position == len(self.ids) or self.lookup[0][position] != movie_id:
+            return None
+        return int(self.lookup[1][position])
+
+    # Function is used to get one value of a row. Only the bytes of the value are read from the file.
+    def value(self, row, column):
+        offsets = self.offsets[self.columns.index(column)]
+        return bytes(self.strings[offsets[row]:offsets[row + 1]]).decode('utf-8')
+
+    # Function is used to get the information of a movie by TMDB id.
+    def fetch(self, movie_id):
+        row = self.row(movie_id)
+        if row is None:
+            return None
+        return {column: self.value(row, column) for column in self.columns}
+
+# Function is used to save the columns used at runtime as a string table, next to the preprocessed dataset it comes from.
+def write_movie_store(df, dataset_path=f"""{cwd}/preprocessed_movie_dataset.csv""", store_dir=cwd, columns=movie_store_columns):
+    ids = df['id'].to_numpy(dtype='int64')
+    order = np.argsort(ids, kind='stable')
+    lookup = np.stack([ids[order], order.astype('int64')])
+    offsets = np.zeros((len(columns), len(df) + 1), dtype='int64')
+    chunks = []
+    size = 0
+    for i, column in enumerate(columns):
+        for j, text in enumerate(df[column].fillna('').astype(str)):
+            data = text.encode('utf-8')
+            chunks.append(data)
+            offsets[i, j] = size
+            size += len(data)
+        offsets[i, len(df)] = size
+    def save_strings(path):
+        with open(path, "wb") as f:
+            f.writelines(chunks)
+    def save_meta(path):
+        with open(path, "w") as f:
+            json.dump({'dataset_hash': dataset_hash(dataset_path), 'num_movies': len(df), 'columns': columns}, f, indent=2)
+    write_atomically(f"""{store_dir}/{movie_store_id_file}""", save_array(ids))
+    write_atomically(f"""{store_dir}/{movie_store_lookup_file}""", save_array(lookup))
+    write_atomically(f"""{store_dir}/{movie_store_offset_file}""", save_array(offsets))
+    write_atomically(f"""{store_dir}/{movie_store_string_file}""", save_strings)
+    write_atomically(f"""{store_dir}/{movie_store_meta_file}""", save_meta)
+
+# Function is used to memory-map the string table. None is returned if it is missing or was saved from another dataset.
+def load_movie_store(dataset_path=f"""{cwd}/preprocessed_movie_dataset.csv""", store_dir=cwd):
+    if not all(os.path.exists(f"""{store_dir}/{file_name}""") for file_name in movie_store_files):
+        return None
+    with open(f"""{store_dir}/{movie_store_meta_file}""", "r") as f:
+        meta = json.load(f)
+    if meta.get('dataset_hash') != dataset_hash(dataset_path):
+        return None
+    ids = np.load(f"""{store_dir}/{movie_store_id_file}""", mmap_mode='r')
+    lookup = np.load(f"""{store_dir}/{movie_store_lookup_file}""", mmap_mode='r')
+    offsets = np.load(f"""{store_dir}/{movie_store_offset_file}""", mmap_mode='r')
+    string_path = f"""{store_dir}/{movie_store_string_file}"""
+    # numpy cannot map an empty file.
+    strings = np.memmap(string_path, dtype='uint8', mode='r') if os.path.getsize(string_path) > 0 else np.zeros(0, dtype='uint8')
+    if len(ids) != meta['num_movies']:
+        return None
+    return MovieStore(ids, lookup, offsets, strings, meta)
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Apr 30 21:08:14 2024
+
+@author: jlkc1
+"""
+
+import os
+import glob
+import time
+import json
+import argparse
+import numpy as np
+from transformers import pipeline, AutoTokenizer
+from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+from Model_Registry import ModelRegistry, model_specs, onnx_models
+
+onnx_model_dir = 'onnx_models'
+onnx_quantized_file = 'model_quantized.onnx'
+
+# Sentences used by the parity check when no other sentences are given.
+parity_sentences = [
+    "I'm feeling sad and lonely today",
+    "I am so happy, today was amazing",
+    "Something scared me on the way home",
+    "I'm really angry at my boss",
+    "yes a movie please",
+    "no thanks, maybe an activity",
+    "sure, go ahead",
+    "I don't think so",
+    "I loved it, sounds great",
+    "That movie sounds boring",
+    "relaxing comedy about friends",
+    "fantasy movies with dragons",
+]
+
+# Function is used to get the folder of the exported model.
+def onnx_model_path(name, model_dir=f"""{os.getcwd()}/{onnx_model_dir}"""):
+    return f"""{model_dir}/{name}"""
+
+# Function is used to export a model to ONNX and quantize its weights to int8 with dynamic quantization.
+def export_onnx_model(name, target='avx2', model_dir=f"""{os.getcwd()}/{onnx_model_dir}"""):
+    task, checkpoint, kwargs = model_specs[name]
+    output_dir = onnx_model_path(name, model_dir)
+    if task == 'sentence-embedding':
+        model = SentenceTransformer(checkpoint, backend='onnx', device='cpu')
+        model.save(output_dir)
+        export_dynamic_quantized_onnx_model(model, target, output_dir, file_suffix='quantized')
+        return output_dir
+    model = ORTModelForSequenceClassification.from_pretrained(checkpoint, export=True)
+    model.save_pretrained(output_dir)
+    AutoTokenizer.from_pretrained(checkpoint).save_pretrained(output_dir)
+    quantization_config = getattr(AutoQuantizationConfig, target)(is_static=False, per_channel=False)
+    ORTQuantizer.from_pretrained(output_dir, file_name='model.onnx').quantize(save_dir=output_dir, quantization_config=quantization_config)
+    return output_dir
+
+# Function is used to load an exported model behind the same calls as the PyTorch model. It returns the model and the size of its ONNX file.
+def load_onnx_model(name, model_dir=f"""{os.getcwd()}/{onnx_model_dir}"""):
+    task, checkpoint, kwargs = model_specs[name]
+    output_dir = onnx_model_path(name, model_dir)
+    if task == 'sentence-embedding':
+        file_name = 'onnx/model_quantized.onnx'
+        model = SentenceTransformer(output_dir, backend='onnx', device='cpu', model_kwargs={'file_name': file_name})
+        return model, os.path.getsize(f"""{output_dir}/{file_name}""")
+    model = ORTModelForSequenceClassification.from_pretrained(output_dir, file_name=onnx_quantized_file)
+    tokenizer = AutoTokenizer.from_pretrained(output_dir)
+    return pipeline(task, model=model, tokenizer=tokenizer, **kwargs), os.path.getsize(f"""{output_dir}/{onnx_quantized_file}""")
+
+# Function is used to get the label of a classifier output, with or without top_k.
+def output_label(output):
+    return output[0]['label'] if isinstance(output, list) else output['label']
+
+# Function is used to compare the quantized ONNX models with the fp32 PyTorch models: label agreement for the classifiers, cosine drift for the encoder.
+def parity_check(sentences, model_dir=f"""{os.getcwd()}/{onnx_model_dir}"""):
+    reference = ModelRegistry(backend='pytorch')
+    candidate = ModelRegistry(backend='onnx', onnx_model_dir=model_dir)
+    report = {}
+    for name in onnx_models:
+        timings = {}
+        outputs = {}
+        for backend, registry in [('pytorch', reference), ('onnx', candidate)]:
+            model = registry.get(name)
+            start = time.perf_counter()
+            if model_specs[name][0] == 'sentence-embedding':
+                outputs[backend] = np.asarray(model.encode(sentences), dtype='float32')
+            else:
+                outputs[backend] = [output_label(output) for output in model(list(sentences))]
+            timings[backend] = round((time.perf_counter() - start) * 1000 / len(sentences), 3)
+        if model_specs[name][0] == 'sentence-embedding':
+            a = outputs['pytorch'] / np.linalg.norm(outputs['pytorch'], axis=1, keepdims=True)
+            b = outputs['onnx'] / np.linalg.norm(outputs['onnx'], axis=1, keepdims=True)
+            drift = 1 - np.sum(a * b, axis=1)
+            report[name] = {'mean_cosine_drift': round(float(drift.mean()), 6), 'max_cosine_drift': round(float(drift.max()), 6)}
+        else:
+            agreement = np.mean([x == y for x, y in zip(outputs['pytorch'], outputs['onnx'])])
+            report[name] = {'label_agreement': round(float(agreement), 4)}
+        report[name]['ms_per_sentence'] = timings
+        report[name]['parameter_bytes'] = {backend: registry.stats[name]['parameter_bytes'] for backend, registry in [('pytorch', reference), ('onnx', candidate)]}
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export the classifiers and the sentence encoder to quantized ONNX and check them against the fp32 models.')
+    parser.add_argument('--export', action='store_true', help='Export and quantize the models.')
+    parser.add_argument('--parity', action='store_true', help='Compare the quantized models with the fp32 models.')
+    parser.add_argument('--target', default='avx2', choices=['avx2', 'avx512', 'avx512_vnni', 'arm64'], help='Instruction set the quantization is tuned for.')
+    parser.add_argument('--sentences', nargs='*', default=None, help='Text files with one sentence per line used by the parity check.')
+    args = parser.parse_args()
+
+    if args.export:
+        for name in onnx_models:
+            print(f"""Exported {name} to {export_onnx_model(name, args.target)}""")
+    if args.parity:
+        sentences = list(parity_sentences)
+        for path in args.sentences or glob.glob(f"""{os.getcwd()}/transcripts/*.txt"""):
+            with open(path, "r", encoding='utf-8') as f:
+                sentences += [line.strip() for line in f if line.strip() and not line.startswith('#')]
+        print(json.dumps(parity_check(sentences), indent=2))
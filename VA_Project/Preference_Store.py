@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Apr 26 20:33:58 2024
+
+@author: jlkc1
+"""
+
+import os
+import re
+import time
+import sqlite3
+import threading
+import numpy as np
+
+# Value of PRAGMA user_version once the preferences of the legacy text file were imported.
+legacy_imported_version = 1
+
+# Class is used to store the movie preferences of every user per mood in SQLite, with the query embedding of each preference.
+class PreferenceStore():
+
+    def __init__(self, path, legacy_path=None):
+        self.path = path
+        self.local = threading.local()
+        connection = self.connection()
+        # WAL lets many readers use the store while one writer saves preferences.
+        connection.execute('PRAGMA journal_mode=WAL')
+        with connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS movie_preference (
+                user_id TEXT NOT NULL,
+                mood TEXT NOT NULL,
+                preference TEXT NOT NULL,
+                embedding BLOB,
+                model_name TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (user_id, mood, preference))""")
+            connection.execute('CREATE INDEX IF NOT EXISTS movie_preference_text ON movie_preference (user_id, preference)')
+        if legacy_path is not None:
+            self.import_legacy_file(legacy_path)
+
+    # Function is used to get the connection of the current thread. SQLite connections are not shared between threads.
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+        return connection
+
+    # Function is used to import the preferences of the tab-separated text file used before, once, for the default user. The import is recorded in the database, so the preferences cleared later are not imported again.
+    def import_legacy_file(self, legacy_path, user_id='default'):
+        connection = self.connection()
+        if connection.execute('PRAGMA user_version').fetchone()[0] >= legacy_imported_version:
+            return 0
+        imported = 0
+        # A store that already has preferences was created before the import was recorded, so the file was already imported.
+        if os.path.exists(legacy_path) and os.stat(legacy_path).st_size > 0 and connection.execute('SELECT 1 FROM movie_preference LIMIT 1').fetchone() is None:
+            with open(legacy_path, "r") as f:
+                for line in f:
+                    word_list = re.split(r'\t+', line)
+                    if len(word_list) > 1 and word_list[1].strip():
+                        self.upsert_preference(user_id, word_list[0].strip(), word_list[1].strip())
+                        imported += 1
+        connection.execute(f"""PRAGMA user_version = {legacy_imported_version}""")
+        return imported
+
+    # Function is used to check if a user has saved any preference.
+    def has_preferences(self, user_id):
+        return self.connection().execute('SELECT 1 FROM movie_preference WHERE user_id = ? LIMIT 1', (user_id,)).fetchone() is not None
+
+    # Function is used to get the preferences of a user for a mood.
+    def get_preferences(self, user_id, mood):
+        rows = self.connection().execute('SELECT preference FROM movie_preference WHERE user_id = ? AND mood = ? ORDER BY updated_at', (user_id, mood)).fetchall()
+        return [row[0] for row in rows]
+
+    # Function is used to get the saved embedding of a preference. None is returned if it is not saved or was computed by another model.
+    def get_embedding(self, user_id, preference, model_name):
+        row = self.connection().execute('SELECT embedding, model_name FROM movie_preference WHERE user_id = ? AND preference = ? AND embedding IS NOT NULL LIMIT 1', (user_id, preference)).fetchone()
+        if row is None or row[1] != model_name:
+            return None
+        return np.frombuffer(row[0], dtype='float32')
+
+    # Function is used to check if a text is one of the preferences of a user.
+    def is_preference(self, user_id, preference):
+        return self.connection().execute('SELECT 1 FROM movie_preference WHERE user_id = ? AND preference = ? LIMIT 1', (user_id, preference)).fetchone() is not None
+
+    # Function is used to add or update one preference of a user.
+    def upsert_preference(self, user_id, mood, preference, embedding=None, model_name=None):
+        blob = None if embedding is None else np.asarray(embedding, dtype='float32').tobytes()
+        with self.connection() as connection:
+            connection.execute("""INSERT INTO movie_preference (user_id, mood, preference, embedding, model_name, updated_at) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, mood, preference) DO UPDATE SET
+                    embedding = COALESCE(excluded.embedding, embedding),
+                    model_name = COALESCE(excluded.model_name, model_name),
+                    updated_at = excluded.updated_at""", (user_id, mood, preference, blob, model_name, time.time()))
+
+    # Function is used to save the embedding of the preferences that have the given text.
+    def set_embedding(self, user_id, preference, embedding, model_name):
+        with self.connection() as connection:
+            connection.execute('UPDATE movie_preference SET embedding = ?, model_name = ? WHERE user_id = ? AND preference = ?', (np.asarray(embedding, dtype='float32').tobytes(), model_name, user_id, preference))
+
+    # Function is used to replace every preference of a user in one transaction. preferences maps a mood to its texts and their embeddings (or None). The moods that are not given are cleared.
+    def set_preferences(self, user_id, preferences, model_name=None):
+        with self.connection() as connection:
+            connection.execute('DELETE FROM movie_preference WHERE user_id = ?', (user_id,))
+            for mood, (texts, embeddings) in preferences.items():
+                for i, preference in enumerate(texts):
+                    blob = None if embeddings is None else np.asarray(embeddings[i], dtype='float32').tobytes()
+                    connection.execute('INSERT OR REPLACE INTO movie_preference (user_id, mood, preference, embedding, model_name, updated_at) VALUES (?, ?, ?, ?, ?, ?)', (user_id, mood, preference, blob, model_name, time.time()))
@@ -5,46 +5,177 @@ Created on Sun Mar 24 23:47:46 2024
 @author: jlkc1
 """
 
-from transformers import pipeline
 import pandas as pd
 import os
+import json
+import hashlib
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from Movie_Index import build_movie_index, update_movie_index
+from Movie_Store import write_movie_store
+from Model_Registry import registry
 
 pd.set_option('display.max_columns', None)
 pd.set_option('display.max_rows', None)
 pd.set_option('display.width', None)
 
 movie_plot_treshold = 100
+summary_batch_size = 8
+summary_checkpoint_every = 10
+summary_threads_per_worker = 2
+summary_cache_file = 'summary_cache.jsonl'
+# Columns compared by the incremental update. A movie is summarized and encoded again only if one of them changed.
+movie_diff_columns = ['title', 'overview']
 cwd = os.getcwd()
 
-def summarization_movie_plot(text):
-    summarizer = pipeline("summarization", model="facebook/bart-large-cnn")
-    movie_plot = f"""{text}"""
-    summary = summarizer(movie_plot, max_length=movie_plot_treshold, do_sample=False)
-    return summary[0]['summary_text']
+# Function is used to key a summary by the overview, the summarization checkpoint and settings, so a changed overview or model is summarized again.
+def overview_hash(text):
+    return hashlib.sha256(f"""{registry.checkpoint('summarization')}\t{movie_plot_treshold}\t{text}""".encode('utf-8')).hexdigest()
 
-def load_movie_dataset():
-    df_movie_dataset = pd.read_csv(f"""{cwd}/tmdb_5000_movies.csv""", memory_map=True)
+# Function is used to load the summaries of previous runs. A line cut short by an interrupted run is ignored.
+def load_summary_cache(cache_path):
+    cache = {}
+    if not os.path.exists(cache_path):
+        return cache
+    with open(cache_path, "r", encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            cache[entry['hash']] = entry['summary']
+    return cache
+
+# Function is used to get the number of worker processes based on the cores available to this process.
+def summary_worker_count(threads_per_worker=summary_threads_per_worker):
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    return max(1, cores // threads_per_worker)
+
+# Function is used to set up a worker process so the workers do not compete for the same cores.
+def init_summary_worker(threads_per_worker):
+    registry.set_num_threads(threads_per_worker)
+
+# Function is used to summarize a batch of movie plots in one forward pass.
+def summarize_batch(hashes, texts):
+    summarizer = registry.get('summarization')
+    summaries = summarizer(texts, max_length=movie_plot_treshold, do_sample=False, truncation=True, batch_size=len(texts))
+    return hashes, [summary['summary_text'] for summary in summaries]
+
+# Function is used to group the plots to summarize into batches of similar length, so little padding is computed.
+def length_bucketed_batches(overviews, batch_size):
+    ordered = sorted(overviews.items(), key=lambda item: len(item[1].split()))
+    batches = []
+    for i in range(0, len(ordered), batch_size):
+        chunk = ordered[i:i + batch_size]
+        batches.append(([h for h, _ in chunk], [text for _, text in chunk]))
+    return batches
+
+# Function is used to summarize the long plots. Summaries are streamed to the cache file, which is also the checkpoint of an interrupted run.
+def summarize_movie_plots(overviews, cache_path=f"""{cwd}/{summary_cache_file}""", batch_size=summary_batch_size, workers=None, checkpoint_every=summary_checkpoint_every, threads_per_worker=summary_threads_per_worker):
+    cache = load_summary_cache(cache_path)
+    pending = {}
+    for text in overviews:
+        key = overview_hash(text)
+        if key not in cache:
+            pending[key] = text
+    if not pending:
+        return cache
+    batches = length_bucketed_batches(pending, batch_size)
+    workers = summary_worker_count(threads_per_worker) if workers is None else workers
+    workers = min(workers, len(batches))
+    print(f"""Summarizing {len(pending)} plots ({len(cache)} cached) in {len(batches)} batches with {workers} worker(s)""")
+    with open(cache_path, "a", encoding='utf-8') as f:
+        # Function is used to save the summaries of a finished batch and checkpoint the cache periodically.
+        def save_batch(done, hashes, summaries):
+            for key, summary in zip(hashes, summaries):
+                cache[key] = summary
+                f.write(json.dumps({'hash': key, 'summary': summary}) + "\n")
+            if done % checkpoint_every == 0 or done == len(batches):
+                f.flush()
+                os.fsync(f.fileno())
+                print(f"""Checkpoint: {done}/{len(batches)} batches summarized""")
+        if workers <= 1:
+            for done, (hashes, texts) in enumerate(batches, start=1):
+                save_batch(done, *summarize_batch(hashes, texts))
+        else:
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_summary_worker, initargs=(threads_per_worker,)) as pool:
+                futures = [pool.submit(summarize_batch, hashes, texts) for hashes, texts in batches]
+                for done, future in enumerate(as_completed(futures), start=1):
+                    save_batch(done, *future.result())
+    return cache
+
+# Function is used to clean a TMDB export. Movies without plot, or with the id or the plot of another movie, are dropped.
+def prepare_movie_export(export_path):
+    df_movie_dataset = pd.read_csv(export_path, memory_map=True)
     df_movie_dataset.dropna(subset=['overview'],inplace=True)
+    df_movie_dataset.drop_duplicates(subset=['id'],inplace=True)
     df_movie_dataset.drop_duplicates(subset=['overview'],inplace=True)
     df_movie_dataset['Length of overview'] = df_movie_dataset['overview'].apply(lambda words: len(words.split()))
-    df_movie_dataset = df_movie_dataset[df_movie_dataset['Length of overview'] > 0]
+    df_movie_dataset = df_movie_dataset[df_movie_dataset['Length of overview'] > 0].copy()
+    return df_movie_dataset
+
+# Function is used to add the summarization of the long plots. The summaries given by TMDB id in previous are reused instead of being summarized again.
+def add_summarization(df_movie_dataset, batch_size=summary_batch_size, workers=None, checkpoint_every=summary_checkpoint_every, previous=None, cache_path=f"""{cwd}/{summary_cache_file}"""):
+    long_plot = df_movie_dataset['Length of overview'] > movie_plot_treshold
+    reused = df_movie_dataset['id'].map(previous) if previous is not None else pd.Series(None, index=df_movie_dataset.index, dtype=object)
+    pending = long_plot & reused.isna()
+    cache = summarize_movie_plots(df_movie_dataset.loc[pending, 'overview'].tolist(), cache_path=cache_path, batch_size=batch_size, workers=workers, checkpoint_every=checkpoint_every)
+    df_movie_dataset['summarization'] = df_movie_dataset['overview']
+    df_movie_dataset.loc[pending, 'summarization'] = df_movie_dataset.loc[pending, 'overview'].apply(lambda text: cache[overview_hash(text)])
+    df_movie_dataset.loc[long_plot & reused.notna(), 'summarization'] = reused[long_plot & reused.notna()]
+    df_movie_dataset['Length of summarization'] = df_movie_dataset['summarization'].apply(lambda words: len(words.split()))
+    return df_movie_dataset
+
+def load_movie_dataset(batch_size=summary_batch_size, workers=None, checkpoint_every=summary_checkpoint_every, export_path=f"""{cwd}/tmdb_5000_movies.csv""", cache_path=f"""{cwd}/{summary_cache_file}"""):
+    df_movie_dataset = prepare_movie_export(export_path)
     
     # Summarization
-    result = []
-    for index, row in df_movie_dataset.iterrows():
-        if row['Length of overview'] > movie_plot_treshold:
-            result.append(summarization_movie_plot(row['overview']))
-        else:
-            result.append(row['overview'])
-            
-    df_movie_dataset['summarization'] = result
-    df_movie_dataset['Length of summarization'] = df_movie_dataset['summarization'].apply(lambda words: len(words.split()))
+    return add_summarization(df_movie_dataset, batch_size, workers, checkpoint_every, cache_path=cache_path)
 
-    return df_movie_dataset
+# Function is used to compare a new TMDB export with the preprocessed dataset by TMDB id. It returns the added, changed and removed ids.
+def diff_movie_exports(old_df, new_df, columns=movie_diff_columns):
+    old = old_df.set_index('id')[columns].fillna('').astype(str)
+    new = new_df.set_index('id')[columns].fillna('').astype(str)
+    added = new.index.difference(old.index)
+    removed = old.index.difference(new.index)
+    common = new.index.intersection(old.index)
+    changed = common[(new.loc[common] != old.loc[common]).any(axis=1).to_numpy()]
+    return added.tolist(), changed.tolist(), removed.tolist()
+
+# Function is used to refresh the preprocessed dataset and the movie index from a new TMDB export. Only the added or changed movies are summarized and encoded.
+def update_movie_dataset(export_path, batch_size=summary_batch_size, workers=None, checkpoint_every=summary_checkpoint_every):
+    dataset_path = f"""{cwd}/preprocessed_movie_dataset.csv"""
+    if not os.path.exists(dataset_path):
+        export_movie_dataset(load_movie_dataset(batch_size, workers, checkpoint_every, export_path))
+        return build_movie_index()
+    old_df = pd.read_csv(dataset_path, memory_map=True)
+    new_df = prepare_movie_export(export_path)
+    added, changed, removed = diff_movie_exports(old_df, new_df)
+    print(f"""Catalogue update: {len(added)} added, {len(changed)} changed, {len(removed)} removed""")
+    # The summaries of the movies whose title and plot did not change are kept.
+    unchanged = old_df[~old_df['id'].isin(changed + removed)]
+    new_df = add_summarization(new_df, batch_size, workers, checkpoint_every, previous=unchanged.set_index('id')['summarization'])
+    export_movie_dataset(new_df)
+    return update_movie_index(dataset_path, changed_ids=changed)
 
+# Function is used to save the preprocessed dataset and, next to it, the movie store with only the columns used at runtime.
 def export_movie_dataset(df):
     df.to_csv(f"""{cwd}/preprocessed_movie_dataset.csv""", encoding='utf-8', index=False)
+    write_movie_store(df, f"""{cwd}/preprocessed_movie_dataset.csv""", cwd)
 
 if __name__ == "__main__":
-    df = load_movie_dataset()
-    export_movie_dataset(df)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Summarize the TMDB movie plots and build the movie index.')
+    parser.add_argument('--update', default=None, metavar='EXPORT', help='Update the dataset and the index from a new TMDB export. Only the added or changed movies are summarized and encoded.')
+    parser.add_argument('--batch-size', type=int, default=summary_batch_size)
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes (default: based on the available cores).')
+    parser.add_argument('--checkpoint-every', type=int, default=summary_checkpoint_every, help='Number of batches between two checkpoints.')
+    args = parser.parse_args()
+    if args.update is not None:
+        meta = update_movie_dataset(args.update, batch_size=args.batch_size, workers=args.workers, checkpoint_every=args.checkpoint_every)
+        print(f"""Indexed {meta['num_movies']} movies, {meta.get('last_update', {}).get('encoded', meta['num_movies'])} encoded""")
+    else:
+        df = load_movie_dataset(batch_size=args.batch_size, workers=args.workers, checkpoint_every=args.checkpoint_every)
+        export_movie_dataset(df)
+        build_movie_index()
\ No newline at end of file
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Thu May  2 19:26:37 2024
+
+@author: jlkc1
+"""
+
+import re
+import time
+import threading
+from collections import OrderedDict
+from Tracing import metrics
+
+query_cache_max_entries = 2048
+query_cache_ttl = 6 * 60 * 60
+
+# Class is used to cache the query embeddings and the search results of repeated queries, with LRU eviction by size and TTL.
+class QueryCache():
+
+    def __init__(self, max_entries=query_cache_max_entries, ttl=query_cache_ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # The cache is emptied when the fingerprint of the movie index changes.
+        self.fingerprint = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # Function is used to normalize a query, so the same words with another case, punctuation or spacing share an entry.
+    def normalize(self, text):
+        return ' '.join(re.sub(r"[^\w\s']", ' ', text.lower()).split())
+
+    # Function is used to get the key of an entry.
+    def key(self, kind, text, extra=()):
+        return (kind, self.normalize(text)) + tuple(extra)
+
+    # Function is used to get a cached value, or None if it is missing or expired.
+    def get(self, kind, text, extra=()):
+        key = self.key(kind, text, extra)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                metrics.increment('cache_hits_total', cache='query', kind=kind)
+                return entry[0]
+            if entry is not None:
+                del self.entries[key]
+                self.evictions += 1
+            self.misses += 1
+            metrics.increment('cache_misses_total', cache='query', kind=kind)
+            return None
+
+    # Function is used to cache a value and evict the least recently used entries above the size limit.
+    def put(self, kind, text, value, extra=()):
+        key = self.key(kind, text, extra)
+        with self.lock:
+            self.entries[key] = (value, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    # Function is used to set the fingerprint of the movie index. Every entry is dropped when the index was rebuilt.
+    def set_fingerprint(self, fingerprint):
+        with self.lock:
+            if fingerprint != self.fingerprint:
+                if self.entries:
+                    self.invalidations += 1
+                self.entries.clear()
+                self.fingerprint = fingerprint
+
+    # Function is used to report the hits and misses of the cache.
+    def get_stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+# Cache shared by every assistant of the process.
+query_cache = QueryCache()
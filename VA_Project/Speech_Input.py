@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun May  5 11:04:52 2024
+
+@author: jlkc1
+"""
+
+import os
+import json
+import time
+import threading
+from collections import deque
+import numpy as np
+from Lazy_Import import lazy_import
+from Tracing import metrics
+from Wake_Word import EnergyGate, frame_energy, wake_sample_rate, wake_frame_ms
+
+# Imported on first use, so the Virtual Assistant listens for the wake up word before they are loaded.
+sr = lazy_import('speech_recognition')
+vosk = lazy_import('vosk')
+
+# 'google' uses the online recognizer, 'vosk' the offline one, 'auto' the online one with the offline one when there is no internet.
+asr_backend_name = os.environ.get('VA_ASR_BACKEND', 'auto')
+asr_model_path = os.environ.get('VA_ASR_MODEL', 'vosk_asr_model')
+
+# Class is used to keep the microphone open for the whole session. A thread reads the frames into a ring buffer, so no audio is lost between two turns and the oldest audio is dropped when nobody listens.
+class AudioStream():
+
+    def __init__(self, sample_rate=wake_sample_rate, frame_ms=wake_frame_ms, buffer_seconds=10):
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.frame_samples = sample_rate * frame_ms // 1000
+        self.frames = deque(maxlen=buffer_seconds * 1000 // frame_ms)
+        self.condition = threading.Condition()
+        self.microphone = None
+        self.thread = None
+        self.running = False
+        self.dropped_frames = 0
+        self.error = None
+
+    # Function is used to open the microphone and start reading it. A stream whose microphone failed is opened again.
+    def start(self):
+        if self.error is not None:
+            self.close()
+            self.error = None
+        if self.thread is None:
+            self.microphone = sr.Microphone(sample_rate=self.sample_rate, chunk_size=self.frame_samples)
+            self.microphone.__enter__()
+            self.running = True
+            self.thread = threading.Thread(target=self.capture, name='va-microphone', daemon=True)
+            self.thread.start()
+        return self
+
+    # Function is used to read the microphone into the ring buffer. If the microphone fails (e.g. it was unplugged), the error is kept for the reader and the stream stops.
+    def capture(self):
+        while self.running:
+            try:
+                frame = self.microphone.stream.read(self.frame_samples)
+            except Exception as e:
+                with self.condition:
+                    self.error = e
+                    self.running = False
+                    self.condition.notify_all()
+                return
+            with self.condition:
+                if len(self.frames) == self.frames.maxlen:
+                    self.dropped_frames += 1
+                self.frames.append(frame)
+                self.condition.notify()
+
+    # Function is used to get the next frame. None is returned if no frame came before the timeout, and the error of the microphone is raised if it failed.
+    def read_frame(self, timeout=None):
+        with self.condition:
+            if not self.frames:
+                self.condition.wait_for(lambda: len(self.frames) > 0 or self.error is not None, timeout)
+            if not self.frames:
+                if self.error is not None:
+                    raise self.error
+                return None
+            return self.frames.popleft()
+
+    # Function is used to drop the buffered audio, e.g. the voice of the Virtual Assistant recorded while it was talking.
+    def flush(self):
+        with self.condition:
+            self.frames.clear()
+
+    # Function is used to stop reading and close the microphone.
+    def close(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+            self.microphone.__exit__(None, None, None)
+            self.thread = None
+
+# Class is used to recognize an utterance with the online Google recognizer.
+class GoogleRecognizer():
+
+    name = 'google'
+
+    def __init__(self):
+        self.recognizer = sr.Recognizer()
+
+    # Function is used to get the text of an utterance. None is returned if no words were recognized.
+    def recognize(self, audio, sample_rate):
+        metrics.increment('network_calls_total', service='google_asr')
+        try:
+            return self.recognizer.recognize_google(sr.AudioData(audio, sample_rate, 2))
+        except sr.UnknownValueError:
+            return None
+
+# Class is used to recognize an utterance on the CPU with an offline Vosk model.
+class VoskRecognizer():
+
+    name = 'vosk'
+
+    def __init__(self, model_path=asr_model_path):
+        vosk.SetLogLevel(-1)
+        self.model = vosk.Model(model_path)
+
+    # Function is used to get the text of an utterance. None is returned if no words were recognized.
+    def recognize(self, audio, sample_rate):
+        recognizer = vosk.KaldiRecognizer(self.model, sample_rate)
+        recognizer.AcceptWaveform(audio)
+        return json.loads(recognizer.FinalResult()).get('text') or None
+
+# Function is used to get the recognizers to try in order. The offline recognizer is only used if its model is installed.
+def load_asr_backends(cwd, name=asr_backend_name, model_path=asr_model_path):
+    model_path = model_path if os.path.isabs(model_path) else f"""{cwd}/{model_path}"""
+    backends = []
+    if name in ['google', 'auto']:
+        backends.append(GoogleRecognizer())
+    if name == 'vosk' or (name == 'auto' and os.path.isdir(model_path)):
+        backends.append(VoskRecognizer(model_path))
+    return backends
+
+# Class is used to capture one utterance per turn from the open stream, end it when the user stops talking and recognize it. The end of turn silence is tuned to the pauses of the user.
+class SpeechInput():
+
+    def __init__(self, stream, backends, hangover_ms=800, min_hangover_ms=300, max_hangover_ms=1200, margin_ms=150, max_utterance_ms=15000, listen_timeout=None):
+        self.stream = stream
+        self.backends = backends
+        self.gate = EnergyGate(stream.sample_rate, stream.frame_ms, hangover_ms=hangover_ms, max_utterance_ms=max_utterance_ms)
+        self.min_hangover_frames = min_hangover_ms // stream.frame_ms
+        self.max_hangover_frames = max_hangover_ms // stream.frame_ms
+        self.margin_frames = margin_ms // stream.frame_ms
+        self.listen_timeout = listen_timeout
+        self.calibrated = False
+        self.turn_timings = []
+
+    # Function is used to measure the noise floor of the room before the first turn.
+    def calibrate(self, seconds=0.5):
+        energies = []
+        for i in range(int(seconds * 1000 / self.stream.frame_ms)):
+            frame = self.stream.read_frame(timeout=1)
+            if frame is not None:
+                energies.append(frame_energy(frame))
+        if energies:
+            self.gate.noise_floor = float(np.median(energies))
+        self.calibrated = True
+
+    # Function is used to set the end of turn silence from the pauses of the user inside the utterances.
+    def adapt_hangover(self):
+        if len(self.gate.pauses) < 5:
+            return
+        pause = int(np.percentile(list(self.gate.pauses), 90))
+        self.gate.hangover_frames = int(min(self.max_hangover_frames, max(self.min_hangover_frames, pause + self.margin_frames)))
+
+    # Function is used to capture the next utterance. None is returned if the user said nothing before the timeout. on_speech_start is called once, when the user starts talking.
+    def capture(self, on_speech_start=None):
+        self.stream.flush()
+        frames = []
+        waited_frames = 0
+        while True:
+            frame = self.stream.read_frame(timeout=1)
+            if frame is None:
+                continue
+            utterance_frames, ended = self.gate.process(frame)
+            if utterance_frames and not frames and on_speech_start is not None:
+                on_speech_start()
+            frames += utterance_frames
+            if ended:
+                return b''.join(frames)
+            if not frames:
+                waited_frames += 1
+                if self.listen_timeout is not None and waited_frames * self.stream.frame_ms >= self.listen_timeout * 1000:
+                    return None
+
+    # Function is used to recognize an utterance with the first recognizer that can be reached.
+    def recognize(self, audio):
+        error = None
+        for backend in self.backends:
+            try:
+                return backend.recognize(audio, self.stream.sample_rate), backend.name
+            except (sr.RequestError, OSError) as e:
+                error = e
+        if error is not None:
+            raise error
+        return None, None
+
+    # Function is used to listen to one turn of the user and record its capture, endpoint and recognition timings.
+    def listen(self, on_speech_start=None):
+        if not self.calibrated:
+            self.calibrate()
+        start = time.perf_counter()
+        audio = self.capture(on_speech_start)
+        captured = time.perf_counter()
+        if audio is None:
+            self.turn_timings.append({'capture_seconds': round(captured - start, 3), 'timeout': True})
+            return None
+        text, backend = self.recognize(audio)
+        self.turn_timings.append({
+            'capture_seconds': round(captured - start, 3),
+            'speech_seconds': round(len(audio) / 2 / self.stream.sample_rate, 3),
+            'endpoint_ms': self.gate.silence_run * self.stream.frame_ms,
+            'recognition_seconds': round(time.perf_counter() - captured, 3),
+            'backend': backend,
+        })
+        self.adapt_hangover()
+        return text
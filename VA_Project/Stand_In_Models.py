@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Apr 20 14:05:33 2024
+
+@author: jlkc1
+"""
+
+import re
+import hashlib
+import numpy as np
+
+# Words used by the stand-in classifiers. Sentences without any of these words get the default label.
+emotion_lexicon = {
+    'anger': ['angry', 'mad', 'furious', 'annoyed', 'upset', 'hate', 'irritated'],
+    'fear': ['scared', 'afraid', 'anxious', 'nervous', 'worried', 'terrified', 'frightened'],
+    'joy': ['happy', 'great', 'good', 'amazing', 'wonderful', 'excited', 'glad', 'fantastic'],
+    'sadness': ['sad', 'down', 'lonely', 'depressed', 'unhappy', 'tired', 'miserable', 'bad'],
+    'surprise': ['surprised', 'unexpected', 'wow', 'shocked'],
+    'disgust': ['disgusted', 'gross', 'disgusting'],
+}
+sentiment_lexicon = {
+    'POSITIVE': ['good', 'great', 'love', 'loved', 'like', 'liked', 'nice', 'awesome', 'perfect', 'fun', 'interesting', 'sounds', 'sure'],
+    'NEGATIVE': ['bad', 'boring', 'hate', 'hated', 'dislike', 'awful', 'terrible', 'not', "don't", 'no', 'never'],
+}
+yes_no_lexicon = {
+    'Yes': ['yes', 'yeah', 'yep', 'sure', 'okay', 'ok', 'alright', 'definitely', 'please', 'course'],
+    'No': ['no', 'nope', 'not', "don't", 'never'],
+}
+
+# Function is used to split a sentence into lower case words.
+def tokenize(text):
+    return re.findall(r"[a-z']+", text.lower())
+
+# Class is used as a local stand-in for a text-classification pipeline. It counts the words of each label in the sentence.
+class StandInClassifier():
+
+    def __init__(self, lexicon, default_label, top_k=None):
+        self.lexicon = {label: set(words) for label, words in lexicon.items()}
+        self.default_label = default_label
+        self.top_k = top_k
+
+    # Function is used to classify one sentence.
+    def classify(self, text):
+        words = tokenize(text)
+        counts = {label: sum(word in vocabulary for word in words) for label, vocabulary in self.lexicon.items()}
+        best = max(counts, key=counts.get)
+        if counts[best] == 0:
+            return {'label': self.default_label, 'score': 0.5}
+        return {'label': best, 'score': counts[best] / max(1, sum(counts.values()))}
+
+    # Function is used to classify a sentence or a list of sentences, with the same output format as the HF pipeline.
+    def __call__(self, inputs, **kwargs):
+        sentences = [inputs] if isinstance(inputs, str) else list(inputs)
+        results = []
+        for sentence in sentences:
+            result = self.classify(sentence)
+            results.append([result] if self.top_k is not None else result)
+        return results
+
+# Class is used as a local stand-in for the sentence encoder. Each word has a fixed random vector and a sentence is the normalized mean of its words.
+class StandInEncoder():
+
+    def __init__(self, dimension=768):
+        self.dimension = dimension
+        self.word_vectors = {}
+
+    # Function is used to get the vector of a word. It is seeded by the word, so it is the same in every process.
+    def word_vector(self, word):
+        if word not in self.word_vectors:
+            seed = int.from_bytes(hashlib.md5(word.encode('utf-8')).digest()[:8], 'little')
+            self.word_vectors[word] = np.random.default_rng(seed).standard_normal(self.dimension).astype('float32')
+        return self.word_vectors[word]
+
+    # Function is used to encode a list of sentences, with the same output format as SentenceTransformer.encode.
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, **kwargs):
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        encoded = np.zeros((len(sentences), self.dimension), dtype='float32')
+        for i, sentence in enumerate(sentences):
+            words = tokenize(sentence)
+            if words:
+                vector = np.mean([self.word_vector(word) for word in words], axis=0)
+                encoded[i] = vector / (np.linalg.norm(vector) + 1e-12)
+        return encoded
+
+# Class is used as a local stand-in for the summarization pipeline. The summary is the first sentence of the plot, cut to max_length words.
+class StandInSummarizer():
+
+    # Function is used to summarize a text or a list of texts, with the same output format as the HF pipeline.
+    def __call__(self, inputs, max_length=100, **kwargs):
+        texts = [inputs] if isinstance(inputs, str) else list(inputs)
+        return [{'summary_text': ' '.join(re.split(r'(?<=[.!?])\s', text.strip())[0].split()[:max_length])} for text in texts]
+
+# Function is used to replace the models of the registry by the local stand-ins, so the Virtual Assistant runs without network.
+def register_stand_in_models(registry):
+    registry.register('emotion', StandInClassifier(emotion_lexicon, 'neutral', top_k=1), 'stand-in/emotion-lexicon')
+    registry.register('sentiment', StandInClassifier(sentiment_lexicon, 'POSITIVE'), 'stand-in/sentiment-lexicon')
+    registry.register('yes_no', StandInClassifier(yes_no_lexicon, 'No', top_k=1), 'stand-in/yes-no-lexicon')
+    registry.register('summarization', StandInSummarizer(), 'stand-in/first-sentence')
+    registry.register('movie_encoder', StandInEncoder(), 'stand-in/hashing-encoder')
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue May  7 21:42:18 2024
+
+@author: jlkc1
+"""
+
+import os
+import json
+import time
+import random
+import atexit
+import threading
+import functools
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Fraction of the turns that are traced. 0 turns the spans off, the counters are always kept.
+trace_sample_rate = float(os.environ.get('VA_TRACE_SAMPLE', '0'))
+trace_file = os.environ.get('VA_TRACE_FILE')
+max_spans = 100000
+
+# Class is used to count the model loads, the cache hits and misses and the network calls, and the time spent in the traced spans.
+class Metrics():
+
+    def __init__(self):
+        self.counters = {}
+        self.span_seconds = {}
+        self.lock = threading.Lock()
+
+    # Function is used to add to a counter. The labels tell apart e.g. the models or the caches.
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    # Function is used to add the duration of a span.
+    def observe(self, span, seconds):
+        with self.lock:
+            total, count = self.span_seconds.get(span, (0.0, 0))
+            self.span_seconds[span] = (total + seconds, count + 1)
+
+    # Function is used to get the value of a counter, e.g. in a report.
+    def get(self, name, **labels):
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    # Function is used to export the counters and the span durations in the Prometheus text format.
+    def prometheus_text(self):
+        with self.lock:
+            counters = dict(self.counters)
+            span_seconds = dict(self.span_seconds)
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"""# TYPE va_{name} counter""")
+            for (counter, labels), value in sorted(counters.items()):
+                if counter == name:
+                    lines.append(f"""va_{name}{format_labels(labels)} {value}""")
+        if span_seconds:
+            lines.append('# TYPE va_span_seconds summary')
+            for span, (total, count) in sorted(span_seconds.items()):
+                lines.append(f"""va_span_seconds_sum{format_labels((('span', span),))} {total:.6f}""")
+                lines.append(f"""va_span_seconds_count{format_labels((('span', span),))} {count}""")
+        return '\n'.join(lines) + '\n'
+
+# Function is used to format the labels of a Prometheus sample.
+def format_labels(labels):
+    if not labels:
+        return ''
+    values = [(key, str(value).replace('"', "'")) for key, value in labels]
+    return '{' + ','.join(f'{key}="{value}"' for key, value in values) + '}'
+
+# Class is used to record the spans of the sampled turns with their session and turn ids, and to save them as a JSON trace.
+class Tracer():
+
+    def __init__(self, sample_rate=trace_sample_rate, metrics=None):
+        self.sample_rate = sample_rate
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.spans = deque(maxlen=max_spans)
+        self.start = time.perf_counter()
+
+    # Function is used to decide if a new turn is traced.
+    def sample(self):
+        return self.sample_rate >= 1 or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    # Function is used to keep a finished span.
+    def record(self, name, start, end, session_id, turn_id, error=None):
+        span = {
+            'name': name,
+            'start': start - self.start,
+            'seconds': end - start,
+            'session_id': session_id,
+            'turn_id': turn_id,
+            'thread': threading.current_thread().name,
+        }
+        if error is not None:
+            span['error'] = error
+        self.spans.append(span)
+        self.metrics.observe(name, end - start)
+
+    # Function is used to trace a method of an assistant. Unsampled turns call the method directly, so the overhead is one check.
+    def wrap(self, va, name, method, new_turn=False):
+        @functools.wraps(method)
+        def traced(*args, **kwargs):
+            if new_turn:
+                va.begin_turn()
+            if not va.trace_sampled:
+                return method(*args, **kwargs)
+            error = None
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            except Exception as e:
+                error = type(e).__name__
+                raise
+            finally:
+                self.record(name, start, time.perf_counter(), va.session_id, va.turn_id, error)
+        return traced
+
+    # Function is used to save the spans as a JSON trace, which can be opened in chrome://tracing or Perfetto.
+    def export(self, path):
+        spans = list(self.spans)
+        threads = {}
+        events = []
+        for span in spans:
+            events.append({
+                'name': span['name'],
+                'ph': 'X',
+                'ts': round(span['start'] * 1e6, 1),
+                'dur': round(span['seconds'] * 1e6, 1),
+                'pid': os.getpid(),
+                'tid': threads.setdefault(span['thread'], len(threads) + 1),
+                'args': {key: value for key, value in span.items() if key in ['session_id', 'turn_id', 'error']},
+            })
+        for thread, tid in threads.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': thread}})
+        with open(path, "w") as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return len(spans)
+
+# Class is used to serve the metrics in the Prometheus text format on GET /metrics.
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.strip('/') != 'metrics':
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = metrics.prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+# Function is used to serve the metrics in a background thread.
+def start_metrics_server(port, host='127.0.0.1'):
+    httpd = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    threading.Thread(target=httpd.serve_forever, name='va-metrics', daemon=True).start()
+    return httpd
+
+# Metrics and tracer shared by the whole process.
+metrics = Metrics()
+tracer = Tracer(metrics=metrics)
+
+if trace_file:
+    atexit.register(tracer.export, trace_file)
@@ -5,37 +5,155 @@ Created on Fri Mar 22 21:23:11 2024
 @author: jlkc1
 """
 
+from Lazy_Import import lazy_import, startup_report
 import numpy as np
-import pandas as pd
 import os
-import re
-import faiss
-import pygame
-import speech_recognition as sr
-import geocoder
-import requests
-from transformers import pipeline
-from sentence_transformers import SentenceTransformer
+import io
+import json
+import time
+import uuid
+import atexit
+import argparse
+import threading
+from collections import OrderedDict
 from termcolor import cprint
-from gtts import gTTS
+from Movie_Index import build_movie_index, load_movie_index, index_fingerprint
+from Model_Registry import registry
+from Audio_Cache import AudioCache
+from Weather_Provider import WeatherProvider
+from Activity_Index import ActivityIndex, ActivitySession
+from Preference_Store import PreferenceStore
+from Query_Cache import query_cache
+from Tracing import tracer, metrics, start_metrics_server
+from Movie_Store import load_movie_store, write_movie_store
+from Wake_Word import WakeWordDetector, KeywordSpotter, wake_model_path
+from Speech_Input import AudioStream, SpeechInput, load_asr_backends
+from Dialogue_Graph import DialogueNode, DialogueGraph, DialogueEngine
 
-pd.set_option('display.max_rows', 100000)
-pd.set_option('display.max_columns', 100000)
-pd.set_option('display.width', 100000)
+# Function is used to set the display options of pandas once it is imported.
+def set_display_options(pd):
+    pd.set_option('display.max_rows', 100000)
+    pd.set_option('display.max_columns', 100000)
+    pd.set_option('display.width', 100000)
+
+# The heavy modules are imported on first use, so the Virtual Assistant listens for the wake up word within a second of the start.
+pd = lazy_import('pandas', on_import=set_display_options)
+pygame = lazy_import('pygame')
+
+# Questions asked to the user based on the detected mood.
+mood_questions = {
+    'anger': "Hey, It seems like you're feeling upset. I'm here for you. Do you want to watch a movie or particiapte in another activity?",
+    'fear': "Oh no, something's scaring you. It's okay, I'm here. Want to watch a movie or do another activity to help you feel better?",
+    'joy': "Hey, you seem happy! It's great to see. Let's keep it going. Can I recommend you a movie to watch or another activity?",
+    'sadness': "It seems like you're feeling down. I'm here if you need me. Can I recommend you a movie to watch or another activity to lift your spirit?",
+}
+
+# Types of movies proposed to the user based on the detected mood.
+movie_keyword_hints = {
+    'anger': "Relaxing comedies, Positive vibe movies, Happy movies??",
+    'fear': "Comforting movies, Relaxing comedies, Funny movies?",
+    'joy': "Comedy movies, Romantic drama movies, Adventure movies?",
+    'sadness': "Fantasy movies, Relaxing comedy movies, Romantic movies",
+}
+
+# Fixed sentences said by the Virtual Assistant. They are pre-rendered in the audio cache.
+static_prompts = [
+    "Sorry, I didn't catch that. Can you please repeat?",
+    "Sorry, I still don't get what you're saying",
+    "I'm going to sign off. If necessary, you can wake me back up. Thank you.",
+    "Signing off. Thank you",
+    "Your preferences have been saved. Thank you!",
+    "Apologies, but I can't identify your current mood. It is out of my scope.",
+    "I'm signing off. If necessary, you can wake me again. Thanks!",
+    "Do you want a movie based on your user preference?",
+    "Would you like me to give you a brief summary of the movie?",
+    "What did you think of the movie?",
+    "I'm sorry the movie is not what you were hoping for. I am searching for another movie based on your preferences.",
+    "I'm sorry the movie is not what you were hoping for. I am searching for another movie based on the information you gave me.",
+    "I'm sorry the movie is not what you were hoping for.",
+    "Do you want me to recommend you another activity instead?",
+    "That's fantastic! I'm glad to hear that.",
+    "Feel free to reach out if you need any other movie. I am signing off. If necessary, you can wake me again. Thank you.",
+    "Would you like me to recommend another movie?",
+    "I regret that I couldn't find a movie that matches your current mood.",
+    "I'm sorry to say that I couldn't determine if you're interested in a movie or an activity.",
+    "I'm signing off for now. If necessary, you can wake me again. Thanks!",
+    "I regret to inform you that I couldn't determine which option you want.",
+    "What do you think about this activity?",
+    "I'm sorry that this wasn't what you were looking for. I do not have any other activity to recommend.",
+    "Feel free to wake me back up if you want any other activity. I am signing off. Thank you.",
+    "I am going to sign off. If necessary, you can wake me back up. Thank you.",
+    "I'm sorry that this wasn't what you were looking for. I am searching for another indoor activity for you.",
+    "I'm sorry that this wasn't what you were looking for. I am searching for another outdoor activity for you.",
+    "I couldn't check the weather right now, so I'll look for an indoor activity.",
+]
+
+# Message printed when the Virtual Assistant starts.
+running_message = "Running... Say 'wake up' to activate Virtual Assistant or 'turn off' for the Virtual Assistant to sign off"
+
+# Methods timed by the tracer. Each call of speech_to_text starts a new turn.
+traced_methods = ['speech_to_text', 'emotion_detection', 'yes_no_question', 'sentiment_detection', 'movie_semantic_search', 'get_query_embeddings', 'load_movie_store', 'load_movie_index', 'get_weather_condition', 'recommend_an_activity', 'audio_play']
 
 class VirtualAssistant():
     
     def __init__(self):
-        self.va_print_without_audio("Running... Say 'wake up' to activate Virtual Assistant or 'turn off' for the Virtual Assistant to sign off")
+        self.va_print_without_audio(running_message)
         self.text = ''
         self.text_emotion = ''
         self.cwd = os.getcwd()
+        self.movie_index = None
+        self.movie_model = None
+        self.movie_store = None
+        # Created on first use, so the assistants that never play audio do not create the cache folder.
+        self.audio_cache = None
+        self.audio_cache_lock = threading.Lock()
+        self.sounds = OrderedDict()
+        self.max_sounds = 64
+        self.sounds_lock = threading.Lock()
+        self.weather_provider = WeatherProvider()
+        self.activity_index = None
+        self.activity_session = ActivitySession()
+        # Titles already recommended in this session, so they are not recommended again.
+        self.recommended_movies = set()
+        self.user_id = 'default'
+        self.preference_store = None
+        self.query_cache = query_cache
+        self.movie_index_lock = threading.Lock()
+        self.warm_up_thread = None
+        self.warm_up_timings = {}
+        self.wake_word_detector = None
+        self.wake_word_available = True
+        self.speech_input = None
+        self.print_speech_timings = False
+        self.session_id = uuid.uuid4().hex
+        self.turn_id = 0
+        self.trace_sampled = False
+        self.dialogue_engine = None
+        self.instrument()
+
+    # Function is used to trace the slow methods of this assistant, including the methods overridden by a subclass.
+    def instrument(self):
+        for name in traced_methods:
+            setattr(self, name, tracer.wrap(self, name, getattr(self, name), new_turn=(name == 'speech_to_text')))
+
+    # Function is used to start a new turn and decide if it is traced.
+    def begin_turn(self):
+        self.turn_id += 1
+        self.trace_sampled = tracer.sample()
+        metrics.increment('turns_total')
     
+    # Function is used to run a text classifier of the model registry on one sentence.
+    def classify(self,name,sentence):
+        classifier = registry.get(name)
+        return classifier([sentence])[0]
+
+    # Function is used to encode queries with the movie encoder in one pass.
+    def encode_queries(self,queries,model):
+        return np.asarray(model.encode(queries), dtype='float32').reshape(len(queries), -1)
+
     # Function is used to detect emotion based on words. A pre-trained model on emotion is used.
     def emotion_detection(self,sentence):
-        classifier = pipeline("text-classification", model="j-hartmann/emotion-english-distilroberta-base", top_k=1)
-        emotion_res = classifier(sentence)
-        self.text_emotion = emotion_res[0]
+        self.text_emotion = self.classify('emotion', sentence)
         return True
     
     # Function is used to ask for the user for input. Incase the input is not correctly captured, the program asks the user up to 3 times what he meant.
@@ -56,10 +174,11 @@ class VirtualAssistant():
         if self.text != '$error$':
             self.user_print(self.text)
     
-    # Function is used to load the Indoor/Outdoor activities from a csv file.
+    # Function is used to load the Indoor/Outdoor activities from a csv file. They are loaded once and reloaded when the file changes.
     def load_activity_file(self):
-        df = pd.read_csv(f"""{self.cwd}/List_Of_Activity.csv""", encoding='latin-1') 
-        return df
+        if self.activity_index is None or self.activity_index.path != f"""{self.cwd}/List_Of_Activity.csv""":
+            self.activity_index = ActivityIndex(f"""{self.cwd}/List_Of_Activity.csv""")
+        return self.activity_index
     
     # Function is used to load the different questions the program can ask to greet the user.
     def load_greet_question(self):
@@ -77,9 +196,15 @@ class VirtualAssistant():
                 new_user_question.append(line.strip())
         return np.random.choice(new_user_question)
     
-    # Function is used to check if the user has any saved preferences.
+    # Function is used to open the preference store. The preferences of the former text file are imported the first time.
+    def load_preference_store(self):
+        if self.preference_store is None or self.preference_store.path != f"""{self.cwd}/User_Preference_Movie.db""":
+            self.preference_store = PreferenceStore(f"""{self.cwd}/User_Preference_Movie.db""", legacy_path=f"""{self.cwd}/User_Preference_Movie.txt""")
+        return self.preference_store
+
+    # Function is used to check if the user has no saved preferences.
     def load_user_preference_movie(self):
-        return os.stat(f"""{self.cwd}/User_Preference_Movie.txt""").st_size == 0
+        return not self.load_preference_store().has_preferences(self.user_id)
     
     # Function is used to load the questions to ask the new user.
     def load_mood_question(self,choice):
@@ -89,15 +214,10 @@ class VirtualAssistant():
 
     # Function is used to get/retrieve the user preferences.
     def get_emotion_user_preference(self,emo_state):
-        user_preference = []
-        with open(f"""{self.cwd}/User_Preference_Movie.txt""", "r") as f:
-            for line in f:
-                word_list = re.split(r'\t+', line)
-                if emo_state in line:
-                   user_preference.append(('movie',word_list[1].strip()))                  
-        return user_preference       
+        preferences = self.load_preference_store().get_preferences(self.user_id, emo_state)
+        return [('movie', preference) for preference in preferences]
 
-    # Function is used to ask the user what type of movies per mood he prefers and saves it to a text file.
+    # Function is used to ask the user what type of movies per mood are preferred and saves them with their query embedding.
     def ask_user_preference_movie(self):
         df_movie = self.load_mood_question('movie')
         #Movie
@@ -111,78 +231,200 @@ class VirtualAssistant():
                 if 'movie' in i.lower():
                     continue
                 new_text += i + ' '
-            response_list.append((row['Mood'],new_text))
-        with open(f"""{self.cwd}/User_Preference_Movie.txt""", "w") as f:
-            for i in response_list:
-                f.write(i[0] + "\t" + i[1] + "\n") 
+            if new_text.strip():
+                response_list.append((row['Mood'],new_text.strip()))
+        # The query embeddings are computed once here, so a search on a preference does not encode it again.
+        model = registry.get('movie_encoder')
+        embeddings = model.encode([i[1] for i in response_list]) if response_list else []
+        preferences = {}
+        for i, (mood, preference) in enumerate(response_list):
+            preferences.setdefault(mood, ([], []))
+            preferences[mood][0].append(preference)
+            preferences[mood][1].append(embeddings[i])
+        # The preferences saved before are replaced, so a mood left without answer has no stale preference.
+        self.load_preference_store().set_preferences(self.user_id, preferences, registry.checkpoint('movie_encoder'))
     
-    # Function is used to load the movie dataset.
-    def load_movie_dataset(self):
-        df_movie_dataset = pd.read_csv(f"""{self.cwd}/preprocessed_movie_dataset.csv""", memory_map=True)
-        return df_movie_dataset
+    # Function is used to open the movie store once. It holds the title and the summarization of every movie, looked up by TMDB id. It is saved from the dataset if it is missing or out of date.
+    def load_movie_store(self):
+        with self.movie_index_lock:
+            if self.movie_store is not None:
+                return self.movie_store
+            dataset_path = f"""{self.cwd}/preprocessed_movie_dataset.csv"""
+            movie_store = load_movie_store(dataset_path, self.cwd)
+            if movie_store is None:
+                df_movie_dataset = pd.read_csv(dataset_path, usecols=['id', 'title', 'summarization'])
+                write_movie_store(df_movie_dataset, dataset_path, self.cwd)
+                movie_store = load_movie_store(dataset_path, self.cwd)
+            self.movie_store = movie_store
+            return movie_store
     
-    # Function is used to create an index of the movie plot based on the user keywords. It uses a pretrained model.
-    def movie_semantic_search(self,query_text):
-        df = self.load_movie_dataset()
-        model = SentenceTransformer('msmarco-distilbert-base-dot-prod-v3')
-        encoded_data = model.encode(df['summarization'].tolist())
-        encoded_data = np.asarray(encoded_data.astype('float32'))
-        index = faiss.IndexIDMap(faiss.IndexFlatIP(768))
-        index.add_with_ids(encoded_data, np.array(range(0, len(df))))
-        faiss.write_index(index, 'movie_plot.index')    
-        results = self.search(df, query_text, top_k=5, index=index, model=model)
+    # Function is used to load the prebuilt movie index once. The index is built and saved if it is missing or out of date.
+    def load_movie_index(self):
+        # The lock keeps the warm-up and the conversation from loading the index twice.
+        with self.movie_index_lock:
+            if self.movie_index is not None:
+                return self.movie_index
+            if self.movie_model is None:
+                self.movie_model = registry.get('movie_encoder')
+            dataset_path = f"""{self.cwd}/preprocessed_movie_dataset.csv"""
+            model_name = registry.checkpoint('movie_encoder')
+            movie_index = load_movie_index(dataset_path, self.cwd, model_name)
+            if movie_index is None:
+                self.va_print_without_audio('Building the movie index. This only happens once per dataset...')
+                build_movie_index(dataset_path, self.cwd, model_name, model=self.movie_model)
+                movie_index = load_movie_index(dataset_path, self.cwd, model_name)
+            # The cached queries and results of an older index are dropped.
+            self.query_cache.set_fingerprint(index_fingerprint(movie_index.meta))
+            self.movie_index = movie_index
+            return movie_index
+
+    # Function is used to search the movie index based on the user keywords or preferences. Only the queries are encoded, the movie plots are encoded offline.
+    def movie_semantic_search(self,queries):
+        if self.movie_store is None:
+            self.load_movie_store()
+        if self.movie_index is None:
+            self.load_movie_index()
+        results = self.search(self.movie_store, queries, top_k=5, index=self.movie_index.index, model=self.movie_model, exclude=tuple(self.recommended_movies))
         return results
 
-    # Function is used to retrieve the movie information.
-    def fetch_movie_info(self, df, dataframe_idx):
-        info = df.iloc[dataframe_idx]
+    # Function is used to retrieve the movie information. None is returned for an id that is not in the store, e.g. the -1 of an empty search slot.
+    def fetch_movie_info(self, movie_store, movie_id):
+        info = movie_store.fetch(movie_id)
+        if info is None:
+            return None
         meta_dict = dict()
         meta_dict['title'] = info['title']
         meta_dict['summarization'] = info['summarization']
         return meta_dict
     
-    # Function is used to search for semantic similarity of the keywords entered by the user and the movie plot.
-    def search(self, df, query, top_k, index, model):
-        query_vector = model.encode([query])
-        top_k = index.search(query_vector, top_k)
-        top_k_ids = top_k[1].tolist()[0]
-        top_k_ids = list(np.unique(top_k_ids))
-        results =  [self.fetch_movie_info(df, idx) for idx in top_k_ids]
-        return results   
-    
+    # Function is used to encode the queries. The cached embeddings, or the saved embeddings of the user preferences, are used first and the other queries are encoded in one pass.
+    def get_query_embeddings(self, queries, model):
+        model_name = registry.checkpoint('movie_encoder')
+        store = self.load_preference_store()
+        query_vectors = [self.query_cache.get('embedding', query, (model_name,)) for query in queries]
+        missing = []
+        for i, query in enumerate(queries):
+            if query_vectors[i] is not None:
+                continue
+            embedding = store.get_embedding(self.user_id, query, model_name)
+            if embedding is not None:
+                query_vectors[i] = embedding.reshape(1, -1)
+                self.query_cache.put('embedding', query, query_vectors[i], (model_name,))
+            else:
+                missing.append(i)
+        if missing:
+            encoded = self.encode_queries([queries[i] for i in missing], model)
+            for i, query_vector in zip(missing, encoded):
+                query_vectors[i] = query_vector.reshape(1, -1)
+                if store.is_preference(self.user_id, queries[i]):
+                    store.set_embedding(self.user_id, queries[i], query_vectors[i][0], model_name)
+                self.query_cache.put('embedding', queries[i], query_vectors[i], (model_name,))
+        return np.concatenate(query_vectors).astype('float32')
+
+    # Function is used to search for semantic similarity of the keywords or the preferences of the user and the movie plot. All the queries are searched in one batch and the movies are ordered by their best score. The titles in exclude are skipped.
+    def search(self, movie_store, queries, top_k, index, model, exclude=()):
+        queries = [queries] if isinstance(queries, str) else list(dict.fromkeys(queries))
+        if not queries:
+            return []
+        # More movies are searched than needed, so the excluded titles can be skipped.
+        search_k = top_k + len(exclude)
+        # Repeated queries reuse the results found with the current index.
+        extra = (search_k,) + tuple(self.query_cache.normalize(query) for query in queries[1:])
+        scored = self.query_cache.get('results', queries[0], extra)
+        if scored is None:
+            query_vectors = self.get_query_embeddings(queries, model)
+            top_k_scores, top_k_ids = index.search(query_vectors, search_k)
+            # A movie found by several queries keeps its best score. The -1 of an empty search slot is skipped.
+            best_scores = {}
+            for idx, score in zip(top_k_ids.ravel().tolist(), top_k_scores.ravel().tolist()):
+                if idx != -1 and score > best_scores.get(idx, -np.inf):
+                    best_scores[idx] = score
+            scored = []
+            for idx, score in sorted(best_scores.items(), key=lambda item: -item[1]):
+                result = self.fetch_movie_info(movie_store, idx)
+                if result is not None:
+                    result['score'] = round(float(score), 4)
+                    scored.append(result)
+            self.query_cache.put('results', queries[0], [dict(result) for result in scored], extra)
+        results = []
+        seen_titles = set(exclude)
+        for result in scored:
+            if result['title'] in seen_titles:
+                continue
+            seen_titles.add(result['title'])
+            results.append(dict(result))
+            if len(results) == top_k:
+                break
+        return results
+
     # Function is used to know if the user said Yes or No based on the user input. It uses a pre-trained model.
     def yes_no_question(self,text):
-        classifier = pipeline("text-classification", model="manohar899/bert_yes_no", top_k=1)
-        res = classifier(text)
         if 'yes' in text:
             return True
         if 'no' in text:
             return False
-        if res[0][0]['label'] == 'Yes':
+        res = self.classify('yes_no', text)
+        if res[0]['label'] == 'Yes':
             return True
         return False
     
     # Function is used to detect the sentiment of the user.
     def sentiment_detection(self,sentence):
-        classifier = pipeline("text-classification", model="distilbert/distilbert-base-uncased-finetuned-sst-2-english")
-        sentiment_res = classifier(sentence)
-        return sentiment_res[0]['label'] == 'POSITIVE'
+        sentiment_res = self.classify('sentiment', sentence)
+        return sentiment_res['label'] == 'POSITIVE'
     
-    # Function is used to convert speech to text as input.
-    def speech_to_text(self,param,msg_error="Sorry, I didn't catch that. Can you please repeat?"):
-        recognizer = sr.Recognizer()
-        recognizer.pause_threshold = 1.2
-        with sr.Microphone() as mic:
-            try:
-                self.va_print_without_audio('Listening...')
-                audio = recognizer.listen(mic)
-                text = recognizer.recognize_google(audio)
-            except:
-                if param:
-                    self.va_print_failure(msg_error)
-                return '$error$'
+    # Function is used to open the microphone once. The stream stays open for the whole session and every turn reads from it.
+    def load_speech_input(self):
+        if self.speech_input is None:
+            self.speech_input = SpeechInput(AudioStream().start(), load_asr_backends(self.cwd))
+        elif self.speech_input.stream.error is not None:
+            # The microphone failed during the previous turn, so it is opened again.
+            self.speech_input.stream.start()
+        return self.speech_input
+
+    # Function is used to convert speech to text as input. on_speech_start is called when the user starts talking.
+    def speech_to_text(self,param,msg_error="Sorry, I didn't catch that. Can you please repeat?",on_speech_start=None):
+        speech_input = self.load_speech_input()
+        self.va_print_without_audio('Listening...')
+        try:
+            text = speech_input.listen(on_speech_start)
+        except Exception:
+            text = None
+        if self.print_speech_timings and speech_input.turn_timings:
+            print(json.dumps(speech_input.turn_timings[-1]))
+        if text is None:
+            if param:
+                self.va_print_failure(msg_error)
+            return '$error$'
         return text
     
+    # Function is used to load the on-device wake word detector once. None is returned if no keyword model is installed.
+    def load_wake_word_detector(self):
+        model_path = wake_model_path if os.path.isabs(wake_model_path) else f"""{self.cwd}/{wake_model_path}"""
+        if self.wake_word_detector is None and self.wake_word_available:
+            if not os.path.isdir(model_path):
+                self.wake_word_available = False
+                return None
+            try:
+                self.wake_word_detector = WakeWordDetector(KeywordSpotter(model_path))
+            except ImportError:
+                self.va_print_without_audio('Install vosk to spot the wake up word on the device. The online recognizer is used instead.')
+                self.wake_word_available = False
+        return self.wake_word_detector
+
+    # Function is used to wait for the wake up or turn off words. They are spotted on the device, so no audio is sent to the online recognizer before the wake up word.
+    def listen_for_wake_word(self):
+        detector = self.load_wake_word_detector()
+        if detector is None:
+            return self.speech_to_text(param=False)
+        stream = self.load_speech_input().stream
+        self.va_print_without_audio('Listening...')
+        stream.flush()
+        try:
+            return detector.listen(stream.read_frame)
+        except Exception:
+            return '$error$'
+
     # Function is used to print the virtual assistant interactions.
     def va_print(self,text):
         cprint('[Virtual Assistant]', 'white', 'on_cyan', end=" ")
@@ -209,17 +451,81 @@ class VirtualAssistant():
         cprint(text)
         print('')
 
+    # Function is used to open the audio cache once.
+    def load_audio_cache(self):
+        with self.audio_cache_lock:
+            if self.audio_cache is None:
+                self.audio_cache = AudioCache(f"""{self.cwd}/tts_cache""")
+            return self.audio_cache
+
+    # Function is used to get the sound of a text. Recent sounds are kept in memory and the audio comes from the cache on disk.
+    def load_sound(self,text):
+        # The sounds are loaded from the prefetch threads and played from the main thread, so the mixer and the recent sounds are shared under a lock. The speech is synthesized outside of it.
+        with self.sounds_lock:
+            if not pygame.mixer.get_init():
+                pygame.mixer.init()
+            sound = self.sounds.get(text)
+            if sound is not None:
+                self.sounds.move_to_end(text)
+                return sound
+        sound = pygame.mixer.Sound(file=io.BytesIO(self.load_audio_cache().get(text)))
+        with self.sounds_lock:
+            self.sounds[text] = sound
+            self.sounds.move_to_end(text)
+            if len(self.sounds) > self.max_sounds:
+                self.sounds.popitem(last=False)
+        return sound
+
     # Function is used to convert text to speech for the virtual assistant interactions.
     def audio_play(self,text):
-        speaker = gTTS(text=text, lang="en", slow=False)
-        path = os.getcwd() + "/speech_t5.wav"
-        speaker.save(path)
-        # Play the saved audio.
-        pygame.mixer.init()
-        my_sound = pygame.mixer.Sound(path)
+        my_sound = self.load_sound(text)
         my_sound.play()
         pygame.time.wait(int(my_sound.get_length() * 1000))
 
+    # Function is used to prepare the audio of a sentence the Virtual Assistant may say next, so it plays without waiting for the speech synthesis.
+    def prefetch_audio(self,text):
+        self.load_sound(text)
+
+    # Function is used to pre-render every fixed sentence of the virtual assistant in the audio cache.
+    def build_audio_cache(self):
+        prompts = list(static_prompts) + list(mood_questions.values())
+        prompts += [f"""What type of movie are you in the mood to watch? {hint}""" for hint in movie_keyword_hints.values()]
+        for file_name in ['Greet_Question.txt', 'New_User_Question.txt']:
+            with open(f"""{self.cwd}/{file_name}""", "r") as f:
+                prompts += [line.strip() for line in f if line.strip()]
+        prompts += self.load_mood_question('movie')['Question'].tolist()
+        return self.load_audio_cache().build(prompts)
+
+    # Function is used to load the modules, the models, the movie index and the audio of the fixed sentences while the Virtual Assistant waits for the wake up word. The time of each step is recorded.
+    def warm_up(self,report=False):
+        steps = [
+            ('imports', lambda: [module.load() for module in [pd, pygame]]),
+            ('models', lambda: registry.warm_up(background=False)),
+            ('movie_store', self.load_movie_store),
+            ('movie_index', self.load_movie_index),
+            ('audio_cache', self.build_audio_cache),
+        ]
+        for name, step in steps:
+            if name in ['movie_store', 'movie_index'] and not os.path.exists(f"""{self.cwd}/preprocessed_movie_dataset.csv"""):
+                continue
+            start = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                # A failed step is done again on first use, e.g. the audio of a sentence without network.
+                self.warm_up_timings[name] = {'seconds': round(time.perf_counter() - start, 3), 'error': str(e)}
+                continue
+            self.warm_up_timings[name] = {'seconds': round(time.perf_counter() - start, 3)}
+        if report:
+            print(json.dumps({'warm_up': self.warm_up_timings, **startup_report()}, indent=2))
+
+    # Function is used to start the warm-up in a background thread once.
+    def start_warm_up(self,report=False):
+        if self.warm_up_thread is None:
+            self.warm_up_thread = threading.Thread(target=self.warm_up, args=(report,), name='va-warm-up', daemon=True)
+            self.warm_up_thread.start()
+        return self.warm_up_thread
+
     # Function is used to check if there is no error that was encountered when the user said something.
     def no_error(self,text):
         if text == '$error$' or text == '$skip$' or ('turn off' in text):
@@ -235,21 +541,17 @@ class VirtualAssistant():
         if 'turn off' in text:
             return "Signing off. Thank you"
 
-    # Function is used to get the Virtual Assistant location.
+    # Function is used to get the weather at the Virtual Assistant location. An indoor activity is proposed if the weather is unknown.
     def get_weather_condition(self):
-        myloc = geocoder.ip('me')
-        lat = myloc.lat
-        lng = myloc.lng
-        key = 'ea41b7fca1bc919a190c2a37a6cbcfbe'
-        unit = 'metric'
-        response = requests.get(f"""https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lng}&appid={key}&units={unit}""")
-        if response.status_code == 200 and 'application/json' in response.headers.get('Content-Type',''):
-            res_json = response.json()
+        res_json = self.weather_provider.get_weather()
+        weather_prefix = "I couldn't check the weather right now, so I'll look for an indoor activity."
+        weather_desc = ''
+        filter_data = "indoor"
+        if res_json is not None:
             location_name = res_json['name']
             temp = round(res_json['main']['temp'])
             weather_prefix = f"""For {location_name}, the temperature is currently {temp} degree celcius."""
             weather_id = res_json['weather'][0]['id']
-            weather_desc = ''
             
             if weather_id >= 200 and weather_id < 300:
                 weather_desc = "We're expecting a passing thunderstorm today, so brace yourself for some rumbles and heavy rain."
@@ -288,16 +590,14 @@ class VirtualAssistant():
     
     # Function is used to recommend an activity based on the weather.
     def recommend_an_activity(self,emo_state):
-        df = self.load_activity_file()
+        activity_index = self.load_activity_file()
         # Based on the weather, propose an indoor or outdoor activity
         weather_condition, filter_data = self.get_weather_condition()
         self.va_print(weather_condition)
-        df = df.loc[df['Mood'] == emo_state]
-        df = df.loc[df['Indoor/Outdoor'] == filter_data]
-        reindex_df = df.reindex(np.random.permutation(df.index)).head(5)
+        activities = activity_index.sample(emo_state, filter_data, self.activity_session, k=2)
         count_activity = 0
-        # The user is recommended randomly 2 activities based on his mood/emotion.
-        for index, row in reindex_df.iterrows():
+        # The user is recommended randomly 2 activities based on the mood/emotion, skipping the ones already suggested.
+        for row in activities:
             if count_activity > 1:
                 break
             if count_activity == 0:
@@ -306,8 +606,8 @@ class VirtualAssistant():
                 self.va_print(f"""I've found a different activity, and it is {row['Activities']}""")
             ques = 'What do you think about this activity?'
             self.ask_to_user(f"""{ques}""")
-            if not self.no_error(va.text):
-                self.va_print(va.msg_error(va.text))
+            if not self.no_error(self.text):
+                self.va_print(self.msg_error(self.text))
                 break
             if not self.sentiment_detection(self.text):
                 if count_activity == 0:
@@ -322,17 +622,305 @@ class VirtualAssistant():
                 break
             count_activity = count_activity + 1
  
-if __name__ == "__main__":
-    
-    # Create a new instance of the class VirtualAssistant defined above.
-    va = VirtualAssistant()
+# Class is used to keep what the conversation learned about the user between the steps of the dialogue graph.
+class ConversationContext():
+
+    def __init__(self):
+        self.emo_state = None
+        self.user_pref_op = False
+        self.to_query = ''
+        self.queries = []
+        self.results = []
+        self.count_movie = 0
 
+    # Function is used to get the movie offered in the current step, or None if there is none.
+    def current_movie(self, offset=0):
+        if 0 <= self.count_movie + offset < len(self.results):
+            return self.results[self.count_movie + offset]
+        return None
+
+# Function is used to greet the user once the wake up word is detected. A new user is first asked for the movie preferences.
+def step_wake(va, context):
+    if va.load_user_preference_movie():
+        return 'onboarding'
+    return 'greet'
+
+# Function is used to ask the new user if the movie preferences should be saved.
+def step_onboarding(va, context):
+    ques = va.load_new_user_question()
+    va.ask_to_user(f"""{ques}""")
+    if not va.no_error(va.text):
+        return 'error'
+    if va.yes_no_question(va.text):
+        va.ask_user_preference_movie()
+        va.va_print('Your preferences have been saved. Thank you!')
+    return 'greet'
+
+# Function is used to ask the user how they feel.
+def step_greet(va, context):
+    ques = va.load_greet_question()
+    va.ask_to_user(f"""{ques}""")
+    if not va.no_error(va.text):
+        return 'error'
+    return 'emotion'
+
+# Function is used to detect the mood of the user. The user can wake the Virtual Assistant again instead of answering.
+def step_emotion(va, context):
+    if 'wake up' in va.text:
+        return 'wake'
+    va.emotion_detection(va.text)
+    context.emo_state = va.text_emotion[0]['label']
+    if context.emo_state not in mood_questions:
+        va.va_print("Apologies, but I can't identify your current mood. It is out of my scope.")
+        va.va_print("I'm signing off. If necessary, you can wake me again. Thanks!")
+        return None
+    return 'mood_question'
+
+# Function is used to ask the user, based on the mood, if a movie or another activity is wanted.
+def step_mood_question(va, context):
+    va.ask_to_user(f"""{mood_questions[context.emo_state]}""")
+    if not va.no_error(va.text):
+        return 'error'
+    if not va.yes_no_question(va.text):
+        # Cannot identify whether the user said yes or no to a movie or activity
+        va.va_print("I regret to inform you that I couldn't determine which option you want.")
+        va.va_print("I'm signing off for now. If necessary, you can wake me again. Thanks!")
+        return None
+    if 'movie' in va.text:
+        return 'movie_preference'
+    if 'activity' in va.text:
+        return 'activity'
+    # Cannot identify whether the user wants a movie or an activity
+    va.va_print("I'm sorry to say that I couldn't determine if you're interested in a movie or an activity.")
+    va.va_print("I'm signing off for now. If necessary, you can wake me again. Thanks!")
+    return None
+
+# Function is used to ask the user with saved preferences if the movie should be based on them. The mood affects the search of the movie. A mood without preference goes to the search by keywords.
+def step_movie_preference(va, context):
+    preferences = [preference for _, preference in va.get_emotion_user_preference(context.emo_state)]
+    if preferences and not va.load_user_preference_movie():
+        ques = 'Do you want a movie based on your user preference?'
+        va.ask_to_user(f"""{ques}""")
+    else:
+        va.text = '$skip$'
+    context.user_pref_op = False
+    if va.yes_no_question(va.text) and va.no_error(va.text):
+        context.user_pref_op = True
+        # Every preference of the mood is searched, in one batch.
+        context.queries = preferences
+        context.to_query = ', '.join(context.queries)
+        return 'movie_search'
+    return 'movie_keywords'
+
+# Function is used to ask the user the type of movie wanted, for a dynamic search by keywords.
+def step_movie_keywords(va, context):
+    ques = f"""What type of movie are you in the mood to watch? {movie_keyword_hints.get(context.emo_state, '')}"""
+    va.ask_to_user(f"""{ques}""")
+    if not va.no_error(va.text):
+        return 'error'
+    # Remove the keyword movie from the string as it will affect the semantic search.
+    context.to_query = ''
+    for i in va.text.split():
+        if 'movie' in i.lower():
+            continue
+        context.to_query += i + ' '
+    context.queries = [context.to_query]
+    return 'movie_search'
+
+# Function is used to search the top 5 movies with a similar semantic. The user is recommended the top 2 based on the semantic score.
+def step_movie_search(va, context):
+    va.va_print_without_audio('Words used for semantic search: ' + context.to_query)
+    context.results = va.movie_semantic_search(context.queries)
+    context.count_movie = 0
+    return 'movie_offer'
+
+# Function is used to tell the user the name of the movie found and ask if a summary is wanted.
+def step_movie_offer(va, context):
+    if context.count_movie > 1:
+        return None
+    movie = context.current_movie()
+    if movie is None:
+        # When every movie found was offered, the last answer of the user is taken as a new mood.
+        return 'emotion'
+    if context.count_movie == 0:
+        if context.user_pref_op:
+            va.va_print(f"""Based on your preferences, I found a movie that might interest you. The movie name is {movie['title']}""")
+        else:
+            va.va_print(f"""Based on the keywords you said, I found a movie that might interest you. The movie name is {movie['title']}""")
+    else:
+        va.va_print(f"""I have found another movie. The movie name is {movie['title']}""")
+    va.recommended_movies.add(movie['title'])
+    ques = 'Would you like me to give you a brief summary of the movie?'
+    va.ask_to_user(f"""{ques}""")
+    if not va.no_error(va.text):
+        return 'error'
+    if va.yes_no_question(va.text):
+        return 'movie_feedback'
+    return 'movie_another'
+
+# Function is used to give the summary of the movie and get the sentiment of the user. If the user does not like it, another movie is recommended.
+def step_movie_feedback(va, context):
+    movie = context.current_movie()
+    va.va_print(f"""Here's a quick overview of the movie {movie['title']}""")
+    va.va_print(f"""{movie['summarization']}""")
+    ques = 'What did you think of the movie?'
+    va.ask_to_user(f"""{ques}""")
+    if not va.no_error(va.text):
+        return 'error'
+    if va.sentiment_detection(va.text):
+        va.va_print("That's fantastic! I'm glad to hear that.")
+        va.va_print("Feel free to reach out if you need any other movie. I am signing off. If necessary, you can wake me again. Thank you.")
+        return None
+    if context.count_movie == 0:
+        if context.user_pref_op:
+            va.va_print("I'm sorry the movie is not what you were hoping for. I am searching for another movie based on your preferences.")
+        else:
+            va.va_print("I'm sorry the movie is not what you were hoping for. I am searching for another movie based on the information you gave me.")
+        context.count_movie += 1
+        return 'movie_offer'
+    va.va_print("I'm sorry the movie is not what you were hoping for.")
+    return 'activity_offer'
+
+# Function is used to ask the user who does not want the summary if another movie should be recommended.
+def step_movie_another(va, context):
+    ques = "Would you like me to recommend another movie?"
+    va.ask_to_user(f"""{ques}""")
+    if not va.no_error(va.text):
+        return 'error'
+    if not va.yes_no_question(va.text):
+        va.va_print("I regret that I couldn't find a movie that matches your current mood.")
+        return 'activity_offer'
+    context.count_movie += 1
+    return 'movie_offer'
+
+# Function is used to offer an activity when no movie suited the user.
+def step_activity_offer(va, context):
+    ques = "Do you want me to recommend you another activity instead?"
+    va.ask_to_user(f"""{ques}""")
+    if va.yes_no_question(va.text):
+        return 'activity'
+    return None
+
+# Function is used to recommend an activity based on the weather.
+def step_activity(va, context):
+    va.recommend_an_activity(context.emo_state)
+    return None
+
+# Function is used to tell the user the error that ended the conversation.
+def step_error(va, context):
+    va.va_print(va.msg_error(va.text))
+    return None
+
+# Function is used to load models of the registry before a step needs them.
+def prefetch_models(*names):
+    def task(va, context, cancelled):
+        for name in names:
+            if cancelled.is_set():
+                return
+            registry.get(name)
+    return task
+
+# Function is used to prepare the audio of the sentences a step may say. A sentence can depend on the context, e.g. the title of the movie.
+def prefetch_speech(*sentences):
+    def task(va, context, cancelled):
+        for sentence in sentences:
+            if cancelled.is_set():
+                return
+            text = sentence(context) if callable(sentence) else sentence
+            if text:
+                va.prefetch_audio(text)
+    return task
+
+# Function is used to open the movie store and load the movie index. The search on the movie preferences of the mood is run too, so its results are cached if the user wants them.
+def prefetch_movie_search(va, context, cancelled):
+    if not os.path.exists(f"""{va.cwd}/preprocessed_movie_dataset.csv"""):
+        return
+    va.load_movie_store()
+    if cancelled.is_set():
+        return
+    va.load_movie_index()
+    user_pref = va.get_emotion_user_preference(context.emo_state)
+    if user_pref and not cancelled.is_set():
+        va.movie_semantic_search([preference for _, preference in user_pref])
+
+# Function is used to fetch the weather and load the activities.
+def prefetch_activity(va, context, cancelled):
+    va.weather_provider.prefetch()
+    va.load_activity_file()
+
+# Function is used to get the sentence of the step that offers a movie.
+def movie_title_sentence(offset):
+    def sentence(context):
+        movie = context.current_movie(offset)
+        if movie is None:
+            return None
+        if context.count_movie + offset == 0:
+            if context.user_pref_op:
+                return f"""Based on your preferences, I found a movie that might interest you. The movie name is {movie['title']}"""
+            return f"""Based on the keywords you said, I found a movie that might interest you. The movie name is {movie['title']}"""
+        return f"""I have found another movie. The movie name is {movie['title']}"""
+    return sentence
+
+# Function is used to get the overview and the summary of the movie offered.
+def movie_summary_sentences():
+    def overview(context):
+        movie = context.current_movie()
+        return f"""Here's a quick overview of the movie {movie['title']}""" if movie is not None else None
+    def summary(context):
+        movie = context.current_movie()
+        return f"""{movie['summarization']}""" if movie is not None else None
+    return [overview, summary]
+
+activity_prefetch = [prefetch_activity, prefetch_speech('What do you think about this activity?')]
+
+# Steps of the conversation. While a step waits for the user, the work of its possible next steps is started: the models, the movie index and store, the weather and the audio of the next sentences. The work of the steps not taken is cancelled.
+conversation_graph = DialogueGraph([
+    DialogueNode('wake', step_wake),
+    DialogueNode('onboarding', step_onboarding, {
+        'greet': [prefetch_models('emotion')],
+    }),
+    DialogueNode('greet', step_greet, {
+        'emotion': [prefetch_models('emotion', 'yes_no'), prefetch_speech(*mood_questions.values())],
+    }),
+    DialogueNode('emotion', step_emotion),
+    DialogueNode('mood_question', step_mood_question, {
+        'movie_preference': [prefetch_movie_search, prefetch_speech('Do you want a movie based on your user preference?', lambda context: f"""What type of movie are you in the mood to watch? {movie_keyword_hints.get(context.emo_state, '')}""")],
+        'activity': activity_prefetch,
+    }),
+    DialogueNode('movie_preference', step_movie_preference),
+    DialogueNode('movie_keywords', step_movie_keywords),
+    DialogueNode('movie_search', step_movie_search),
+    DialogueNode('movie_offer', step_movie_offer, {
+        'movie_feedback': [prefetch_models('sentiment'), prefetch_speech(*movie_summary_sentences())],
+        'movie_another': [prefetch_speech("Would you like me to recommend another movie?", movie_title_sentence(1))],
+    }),
+    DialogueNode('movie_feedback', step_movie_feedback, {
+        'movie_offer': [prefetch_speech(movie_title_sentence(1))],
+        'activity_offer': [prefetch_activity],
+    }),
+    DialogueNode('movie_another', step_movie_another, {
+        'activity_offer': [prefetch_activity],
+    }),
+    DialogueNode('activity_offer', step_activity_offer, {
+        'activity': activity_prefetch,
+    }),
+    DialogueNode('activity', step_activity),
+    DialogueNode('error', step_error),
+], start='wake')
+
+# Function is used to run the conversation with the user once the wake up word is detected.
+def run_conversation(va):
+    if va.dialogue_engine is None:
+        va.dialogue_engine = DialogueEngine(conversation_graph)
+    va.dialogue_engine.run(va, ConversationContext())
+
+# Function is used to listen for the wake up word and start a conversation each time it is said.
+def main(va):
     run_wake_word = True
-    run = True
     
     # Loop until the wake up word is said by the user.
     while run_wake_word:
-        text = va.speech_to_text(param=False)
+        text = va.listen_for_wake_word()
         if va.no_error(text): 
             va.user_print(text)
         else:
@@ -342,178 +930,40 @@ if __name__ == "__main__":
             continue
         else:
             va.text = text
-            run = True
+            # Load the models in the background while the user answers the first question.
+            registry.warm_up()
         
         # Once the wake up word is detected, the Virtual Assistant can start interacting with the user.
-        while run:
-            # Wake up the virtual assistant on specific keywords
-            if 'wake up' in va.text:
-                if va.load_user_preference_movie():
-                    ques = va.load_new_user_question()
-                    va.ask_to_user(f"""{ques}""")
-                    if not va.no_error(va.text):
-                        va.va_print(va.msg_error(va.text))
-                        run = False
-                        break
-                    if va.yes_no_question(va.text):
-                        va.ask_user_preference_movie()
-                        va.va_print('Your preferences have been saved. Thank you!')
-                    ques = va.load_greet_question()
-                    va.ask_to_user(f"""{ques}""")
-                    if not va.no_error(va.text):
-                        va.va_print(va.msg_error(va.text))
-                        run = False
-                        break
-                else:
-                    ques = va.load_greet_question()
-                    va.ask_to_user(f"""{ques}""")
-                    if not va.no_error(va.text):
-                        va.va_print(va.msg_error(va.text))
-                        run = False
-                        break
-            elif va.emotion_detection(va.text):
-                emo_state = va.text_emotion[0]['label']
-                # Define questions based on the mood of the user.
-                if emo_state == "anger":
-                    ques = "Hey, It seems like you're feeling upset. I'm here for you. Do you want to watch a movie or particiapte in another activity?"
-                elif emo_state == "fear":
-                    ques = "Oh no, something's scaring you. It's okay, I'm here. Want to watch a movie or do another activity to help you feel better?"
-                elif emo_state == "joy":
-                    ques = "Hey, you seem happy! It's great to see. Let's keep it going. Can I recommend you a movie to watch or another activity?"
-                elif emo_state == "sadness":
-                    ques = "It seems like you're feeling down. I'm here if you need me. Can I recommend you a movie to watch or another activity to lift your spirit?"
-                else:
-                    if not (emo_state in ['anger','fear', 'joy', 'sadness']):
-                        va.va_print("Apologies, but I can't identify your current mood. It is out of my scope.")
-                        va.va_print("I'm signing off. If necessary, you can wake me again. Thanks!")
-                        run = False
-                        break
-                va.ask_to_user(f"""{ques}""")
-                if not va.no_error(va.text):
-                    va.va_print(va.msg_error(va.text))
-                    run = False
-                    break
-                if va.yes_no_question(va.text):
-                    # Recommend a movie
-                    if 'movie' in va.text:
-                        # Ask the user if he wants a movie based on his preferences or if he wants to look for another movie based on his mood.
-                        if not va.load_user_preference_movie():
-                            ques = 'Do you want a movie based on your user preference?'
-                            va.ask_to_user(f"""{ques}""")
-                        else:
-                            va.text = '$skip$'
-                        to_query = ''
-                        # Recommend a movie based on the user preferences. The mood affects the search of the movie.
-                        user_pref_op = False
-                        if va.yes_no_question(va.text) and va.no_error(va.text):
-                            user_pref_op = True
-                            user_pref = va.get_emotion_user_preference(emo_state)
-                            to_query = user_pref[0][1]
-                        else:
-                            # Dynamic search for a movie by user keywords.
-                            movie_item = ''
-                            if emo_state == "anger":
-                                movie_item = "Relaxing comedies, Positive vibe movies, Happy movies??"
-                            elif emo_state == "fear":
-                                movie_item = "Comforting movies, Relaxing comedies, Funny movies?"
-                            elif emo_state == "joy":
-                                movie_item = "Comedy movies, Romantic drama movies, Adventure movies?"
-                            elif emo_state == "sadness":
-                                movie_item = "Fantasy movies, Relaxing comedy movies, Romantic movies"
-                            ques = f"""What type of movie are you in the mood to watch? {movie_item}"""
-                            va.ask_to_user(f"""{ques}""")
-                            split_text = va.text.split()
-                            to_query = ''
-                            # Remove the keyword movie from the string as it will affect the semantic search.
-                            for i in split_text:
-                                if 'movie' in i.lower():
-                                    continue
-                                to_query += i + ' '
-                        if not va.no_error(va.text):
-                            va.va_print(va.msg_error(va.text))
-                            run = False
-                            break
-                        va.va_print_without_audio('Words used for semantic search: ' + to_query)
-                        results = va.movie_semantic_search(to_query)
-                        count_movie = 0
-                        # The top 5 movies that has similar semantic is queried and the user is recommended the top 2 based on the semantic score.
-                        for i in results:
-                            if count_movie > 1:
-                                run = False
-                                break
-                            if count_movie == 0:
-                                if user_pref_op == True:
-                                    va.va_print(f"""Based on your preferences, I found a movie that might interest you. The movie name is {i['title']}""")
-                                else:
-                                    va.va_print(f"""Based on the keywords you said, I found a movie that might interest you. The movie name is {i['title']}""")
-                            if count_movie == 1:
-                                va.va_print(f"""I have found another movie. The movie name is {i['title']}""")
-                            # Ask the user if he would like to have a summary of the movie.
-                            ques = 'Would you like me to give you a brief summary of the movie?'
-                            va.ask_to_user(f"""{ques}""")
-                            if not va.no_error(va.text):
-                                va.va_print(va.msg_error(va.text))
-                                run = False
-                                break
-                            if va.yes_no_question(va.text):
-                                va.va_print(f"""Here's a quick overview of the movie {i['title']}""")
-                                va.va_print(f"""{i['summarization']}""")
-                                ques = 'What did you think of the movie?'
-                                va.ask_to_user(f"""{ques}""")
-                                if not va.no_error(va.text):
-                                    va.va_print(va.msg_error(va.text))
-                                    run = False
-                                    break
-                                # Get the sentiment from the user if he likes the movie based on the summary and if not, the VA recommends the user another movie.
-                                if not va.sentiment_detection(va.text):
-                                    if count_movie == 0:
-                                        if user_pref_op:
-                                            va.va_print("I'm sorry the movie is not what you were hoping for. I am searching for another movie based on your preferences.")
-                                        else:
-                                            va.va_print("I'm sorry the movie is not what you were hoping for. I am searching for another movie based on the information you gave me.")
-                                    else:
-                                        va.va_print("I'm sorry the movie is not what you were hoping for.")
-                                        ques = "Do you want me to recommend you another activity instead?"
-                                        va.ask_to_user(f"""{ques}""")
-                                        if va.yes_no_question(va.text):
-                                            va.recommend_an_activity(emo_state)
-                                        run = False
-                                        break
-                                else:
-                                    va.va_print("That's fantastic! I'm glad to hear that.")
-                                    va.va_print("Feel free to reach out if you need any other movie. I am signing off. If necessary, you can wake me again. Thank you.")
-                                    run = False
-                                    break
-                            else:
-                                ques = "Would you like me to recommend another movie?"
-                                va.ask_to_user(f"""{ques}""")
-                                if not va.no_error(va.text):
-                                    va.va_print(va.msg_error(va.text))
-                                    run = False
-                                    break
-                                if not va.yes_no_question(va.text):
-                                    va.va_print("I regret that I couldn't find a movie that matches your current mood.")
-                                    ques = "Do you want me to recommend you another activity instead?"
-                                    va.ask_to_user(f"""{ques}""")
-                                    if va.yes_no_question(va.text):
-                                        va.recommend_an_activity(emo_state)
-                                    run = False
-                                    break
-                            count_movie = count_movie + 1  
-                    elif 'activity' in va.text:
-                        # Recommend an activity
-                        va.recommend_an_activity(emo_state)
-                        run = False
-                        break
-                    else:
-                        # Cannot identify whether the user wants a movie or an activity
-                        va.va_print("I'm sorry to say that I couldn't determine if you're interested in a movie or an activity.")
-                        va.va_print("I'm signing off for now. If necessary, you can wake me again. Thanks!")
-                        run = False
-                        break
-                else:
-                    # Cannot identify whether the user said yes or no to a movie or activity
-                    va.va_print("I regret to inform you that I couldn't determine which option you want.")
-                    va.va_print("I'm signing off for now. If necessary, you can wake me again. Thanks!")
-                    run = False
-                    break
\ No newline at end of file
+        run_conversation(va)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Virtual Assistant for mood-match activities.')
+    parser.add_argument('--build-audio-cache', action='store_true', help='Pre-render the fixed sentences of the Virtual Assistant and exit.')
+    parser.add_argument('--no-warm-up', action='store_true', help='Load the models, the movie index and the audio on first use instead of in the background.')
+    parser.add_argument('--startup-report', action='store_true', help='Print the import and warm-up timings.')
+    parser.add_argument('--speech-timings', action='store_true', help='Print the capture, endpoint and recognition timings of every turn.')
+    parser.add_argument('--trace-sample', type=float, default=None, help='Fraction of the turns that are traced (default: VA_TRACE_SAMPLE or 0).')
+    parser.add_argument('--trace-file', default=None, help='Save the traced spans to this JSON file on exit.')
+    parser.add_argument('--metrics-port', type=int, default=None, help='Serve the metrics in the Prometheus text format on this port.')
+    args = parser.parse_args()
+    
+    # Create a new instance of the class VirtualAssistant defined above.
+    if args.trace_sample is not None:
+        tracer.sample_rate = args.trace_sample
+    if args.trace_file is not None:
+        atexit.register(tracer.export, args.trace_file)
+    if args.metrics_port is not None:
+        start_metrics_server(args.metrics_port)
+    va = VirtualAssistant()
+    va.print_speech_timings = args.speech_timings
+    if args.build_audio_cache:
+        rendered = va.build_audio_cache()
+        va.va_print_without_audio(f"""{rendered} sentences added to the audio cache.""")
+        raise SystemExit(0)
+
+    if args.startup_report:
+        print(json.dumps({'ready': startup_report()}, indent=2))
+    # The warm-up runs while the Virtual Assistant waits for the wake up word.
+    if not args.no_warm_up:
+        va.start_warm_up(report=args.startup_report)
+    main(va)
\ No newline at end of file
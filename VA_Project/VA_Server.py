@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Apr 28 19:02:50 2024
+
+@author: jlkc1
+"""
+
+import os
+import json
+import uuid
+import queue
+import argparse
+import threading
+import numpy as np
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from VA_Project import VirtualAssistant, run_conversation, running_message
+from Model_Registry import registry
+from Batch_Scheduler import MicroBatcher
+from Query_Cache import query_cache
+from Tracing import tracer, metrics
+from Stand_In_Models import register_stand_in_models
+
+# Class is used to signal that a session was closed while its conversation was waiting for the user.
+class SessionClosed(Exception):
+    pass
+
+# Class is used to run the conversation of one text session. The models, the movie index and the activity list are shared by every session.
+class SessionAssistant(VirtualAssistant):
+
+    def __init__(self, server, session_id, user_id):
+        self.outbox = []
+        self.outbox_lock = threading.Lock()
+        super().__init__()
+        self.server = server
+        self.session_id = session_id
+        self.user_id = user_id
+        self.inbox = queue.Queue()
+        self.turn_done = threading.Event()
+        self.ended = False
+        self.movie_index = server.movie_index
+        self.movie_store = server.movie_store
+        self.movie_model = server.movie_model
+        self.activity_index = server.activity_index
+        self.preference_store = server.preference_store
+        self.weather_provider = server.weather_provider
+
+    # Function is used to keep a message for the client instead of printing it.
+    def add_message(self, speaker, text):
+        with self.outbox_lock:
+            self.outbox.append({'speaker': speaker, 'text': text})
+
+    # Function is used to give the client the messages since its last request.
+    def take_messages(self):
+        with self.outbox_lock:
+            messages, self.outbox = self.outbox, []
+        return messages
+
+    def va_print(self,text):
+        self.add_message('assistant', text)
+
+    def va_print_failure(self,text):
+        self.add_message('assistant', text)
+
+    # The console messages of the Virtual Assistant are not sent to the client.
+    def va_print_without_audio(self,text):
+        if text not in ['Listening...', running_message]:
+            self.add_message('assistant', text)
+
+    def user_print(self,text):
+        pass
+
+    def audio_play(self,text):
+        pass
+
+    def prefetch_audio(self,text):
+        pass
+
+    # Function is used to wait for the next message of the client. The turn of the assistant ends here.
+    def speech_to_text(self,param,msg_error="Sorry, I didn't catch that. Can you please repeat?"):
+        self.turn_done.set()
+        try:
+            text = self.inbox.get(timeout=self.server.session_timeout)
+        except queue.Empty:
+            raise SessionClosed()
+        if text is None:
+            raise SessionClosed()
+        return text
+
+    # Function is used to read the wake up word from the messages of the client instead of the microphone.
+    def listen_for_wake_word(self):
+        return self.speech_to_text(param=False)
+
+    # Function is used to run the classifiers through the shared micro-batchers.
+    def classify(self,name,sentence):
+        return self.server.batchers[name](sentence)
+
+    # Function is used to encode the queries through the shared micro-batcher. They are queued together, so they run in the same batch.
+    def encode_queries(self,queries,model):
+        futures = [self.server.batchers['movie_encoder'].submit(query) for query in queries]
+        return np.asarray([future.result() for future in futures], dtype='float32')
+
+    # Function is used to wait for the wake up word and run one conversation. The session ends with the conversation, and is marked ended before the last answer is released.
+    def run(self):
+        try:
+            while 'wake up' not in self.text:
+                self.text = self.listen_for_wake_word()
+            run_conversation(self)
+        except SessionClosed:
+            pass
+        except Exception as e:
+            self.add_message('error', str(e))
+        finally:
+            self.ended = True
+            self.server.sessions.pop(self.session_id, None)
+            self.turn_done.set()
+
+    # Function is used to send a message of the client and wait for the answer of the assistant.
+    def send(self, text, timeout):
+        self.turn_done.clear()
+        self.inbox.put(text)
+        self.turn_done.wait(timeout)
+        return self.take_messages()
+
+# Class is used to host many text sessions of the Virtual Assistant on one process.
+class AssistantServer():
+
+    def __init__(self, max_batch_size=16, max_wait_ms=5, session_timeout=600, turn_timeout=60):
+        self.session_timeout = session_timeout
+        self.turn_timeout = turn_timeout
+        self.sessions = {}
+        self.batchers = {}
+        for name in ['emotion', 'sentiment', 'yes_no']:
+            self.batchers[name] = MicroBatcher(self.classifier_batch(name), max_batch_size, max_wait_ms, name)
+        self.batchers['movie_encoder'] = MicroBatcher(lambda queries: registry.get('movie_encoder').encode(queries), max_batch_size, max_wait_ms, 'movie_encoder')
+        # The shared resources are loaded once by a template assistant.
+        template = VirtualAssistant()
+        self.movie_model = registry.get('movie_encoder')
+        has_movies = os.path.exists(f"""{template.cwd}/preprocessed_movie_dataset.csv""")
+        self.movie_index = template.load_movie_index() if has_movies else None
+        self.movie_store = template.load_movie_store() if has_movies else None
+        self.activity_index = template.load_activity_file()
+        self.preference_store = template.load_preference_store()
+        self.weather_provider = template.weather_provider
+
+    # Function is used to get the batched function of a classifier.
+    def classifier_batch(self, name):
+        return lambda sentences: registry.get(name)(list(sentences))
+
+    # Function is used to start a new session. It returns the session and the first messages of the assistant.
+    def create_session(self, user_id='default'):
+        session_id = uuid.uuid4().hex
+        va = SessionAssistant(self, session_id, user_id)
+        self.sessions[session_id] = va
+        threading.Thread(target=va.run, name=f"""va-session-{session_id[:8]}""", daemon=True).start()
+        va.turn_done.wait(self.turn_timeout)
+        return va, va.take_messages()
+
+    # Function is used to close a session.
+    def close_session(self, session_id):
+        va = self.sessions.pop(session_id, None)
+        if va is not None:
+            va.inbox.put(None)
+        return va is not None
+
+    # Function is used to report the number of sessions, the batching of the models and the query cache.
+    def get_stats(self):
+        return {
+            'sessions': len(self.sessions),
+            'batchers': {name: batcher.get_stats() for name, batcher in self.batchers.items()},
+            'models': registry.get_stats()['models'],
+            'query_cache': query_cache.get_stats(),
+        }
+
+# Class is used to handle the HTTP requests of the session API.
+class SessionRequestHandler(BaseHTTPRequestHandler):
+
+    assistant_server = None
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        if length == 0:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    # POST /sessions starts a session, POST /sessions/<id>/messages sends what the user said.
+    def do_POST(self):
+        server = self.assistant_server
+        parts = self.path.strip('/').split('/')
+        try:
+            body = self.read_json()
+        except ValueError:
+            return self.send_json(400, {'error': 'The body must be JSON.'})
+        if parts == ['sessions']:
+            va, messages = server.create_session(body.get('user_id', 'default'))
+            return self.send_json(201, {'session_id': va.session_id, 'messages': messages})
+        if len(parts) == 3 and parts[0] == 'sessions' and parts[2] == 'messages':
+            va = server.sessions.get(parts[1])
+            if va is None:
+                return self.send_json(404, {'error': 'Unknown session.'})
+            if not isinstance(body.get('text'), str):
+                return self.send_json(400, {'error': 'A text is required.'})
+            messages = va.send(body['text'].lower(), server.turn_timeout)
+            return self.send_json(200, {'session_id': va.session_id, 'messages': messages, 'ended': va.ended})
+        self.send_json(404, {'error': 'Unknown path.'})
+
+    # DELETE /sessions/<id> closes a session.
+    def do_DELETE(self):
+        parts = self.path.strip('/').split('/')
+        if len(parts) == 2 and parts[0] == 'sessions' and self.assistant_server.close_session(parts[1]):
+            return self.send_json(200, {'session_id': parts[1], 'ended': True})
+        self.send_json(404, {'error': 'Unknown session.'})
+
+    # GET /stats reports the sessions, the batching of the models and the query cache. GET /metrics exports the counters in the Prometheus text format.
+    def do_GET(self):
+        if self.path.strip('/') == 'stats':
+            return self.send_json(200, self.assistant_server.get_stats())
+        if self.path.strip('/') == 'metrics':
+            data = metrics.prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        self.send_json(404, {'error': 'Unknown path.'})
+
+    def log_message(self, format, *args):
+        pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Host many text sessions of the Virtual Assistant with shared, micro-batched models.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-batch-size', type=int, default=16, help='Largest number of calls run in one forward pass.')
+    parser.add_argument('--max-wait-ms', type=float, default=5, help='Longest time a call waits for others to join its batch.')
+    parser.add_argument('--session-timeout', type=float, default=600, help='Seconds of inactivity after which a session is closed.')
+    parser.add_argument('--stand-in-models', action='store_true', help='Use the local stand-in models instead of the pre-trained models.')
+    parser.add_argument('--trace-sample', type=float, default=None, help='Fraction of the turns that are traced (default: VA_TRACE_SAMPLE or 0).')
+    args = parser.parse_args()
+
+    if args.trace_sample is not None:
+        tracer.sample_rate = args.trace_sample
+
+    if args.stand_in_models:
+        register_stand_in_models(registry)
+    else:
+        registry.warm_up(background=False)
+    SessionRequestHandler.assistant_server = AssistantServer(args.max_batch_size, args.max_wait_ms, args.session_timeout)
+    httpd = ThreadingHTTPServer((args.host, args.port), SessionRequestHandler)
+    print(f"""Serving the Virtual Assistant on http://{args.host}:{args.port}""")
+    httpd.serve_forever()
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat May  4 14:37:09 2024
+
+@author: jlkc1
+"""
+
+import os
+import json
+import time
+import glob
+import wave
+import argparse
+from collections import deque
+import numpy as np
+from Lazy_Import import lazy_import
+
+# Imported on first use, so it is only needed when a keyword model is installed.
+vosk = lazy_import('vosk')
+
+wake_keywords = ['wake up', 'turn off']
+wake_sample_rate = 16000
+wake_frame_ms = 30
+wake_model_path = os.environ.get('VA_WAKE_MODEL', 'vosk_model')
+
+# Function is used to get the energy (RMS) of a frame of 16-bit PCM audio.
+def frame_energy(frame):
+    samples = np.frombuffer(frame, dtype='int16').astype('float32')
+    if len(samples) == 0:
+        return 0.0
+    return float(np.sqrt(np.mean(samples * samples)))
+
+# Class is used to find the utterances in the microphone frames with an energy gate that follows the noise floor. Only the frames of an utterance are given to the keyword model.
+class EnergyGate():
+
+    def __init__(self, sample_rate=wake_sample_rate, frame_ms=wake_frame_ms, ratio=3.0, min_energy=150, onset_ms=90, hangover_ms=450, pre_roll_ms=300, max_utterance_ms=3000, noise_adapt=0.05):
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.frame_samples = sample_rate * frame_ms // 1000
+        # A frame is voiced when its energy is ratio times above the noise floor.
+        self.ratio = ratio
+        self.min_energy = min_energy
+        self.onset_frames = max(1, onset_ms // frame_ms)
+        self.hangover_frames = max(1, hangover_ms // frame_ms)
+        self.max_utterance_frames = max(1, max_utterance_ms // frame_ms)
+        self.noise_adapt = noise_adapt
+        self.noise_floor = None
+        # The frames before the onset are kept, so the start of the first word is not lost.
+        self.pre_roll = deque(maxlen=max(self.onset_frames, pre_roll_ms // frame_ms))
+        self.in_speech = False
+        self.voiced_run = 0
+        self.silence_run = 0
+        self.utterance_frames = 0
+        # Length in frames of the pauses inside the utterances, used to tune the hangover to the speaker.
+        self.pauses = deque(maxlen=64)
+        self.frames = 0
+        self.gated_frames = 0
+
+    # Function is used to get the energy above which a frame is voiced.
+    def threshold(self):
+        return max(self.min_energy, (self.noise_floor or 0.0) * self.ratio)
+
+    # Function is used to process one frame. It returns the frames to give to the keyword model and whether the utterance ended.
+    def process(self, frame):
+        self.frames += 1
+        energy = frame_energy(frame)
+        if self.noise_floor is None:
+            self.noise_floor = energy
+        voiced = energy > self.threshold()
+        if not self.in_speech:
+            self.pre_roll.append(frame)
+            if voiced:
+                self.voiced_run += 1
+            else:
+                self.voiced_run = 0
+                self.noise_floor += self.noise_adapt * (energy - self.noise_floor)
+            if self.voiced_run < self.onset_frames:
+                return [], False
+            self.in_speech = True
+            self.silence_run = 0
+            frames = list(self.pre_roll)
+            self.pre_roll.clear()
+            self.utterance_frames = len(frames)
+            self.gated_frames += len(frames)
+            return frames, False
+        self.gated_frames += 1
+        self.utterance_frames += 1
+        if voiced:
+            if self.silence_run > 0:
+                self.pauses.append(self.silence_run)
+            self.silence_run = 0
+        else:
+            self.silence_run += 1
+        if self.silence_run >= self.hangover_frames or self.utterance_frames >= self.max_utterance_frames:
+            self.in_speech = False
+            self.voiced_run = 0
+            return [frame], True
+        return [frame], False
+
+# Class is used to recognize the keywords with a small offline Vosk model restricted to a grammar of the keywords.
+class KeywordSpotter():
+
+    def __init__(self, model_path=wake_model_path, keywords=wake_keywords, sample_rate=wake_sample_rate, min_confidence=0.6):
+        vosk.SetLogLevel(-1)
+        self.keywords = keywords
+        self.min_confidence = min_confidence
+        self.model = vosk.Model(model_path)
+        # Any other speech is matched to [unk], so it is never taken for a keyword.
+        self.recognizer = vosk.KaldiRecognizer(self.model, sample_rate, json.dumps(keywords + ['[unk]']))
+        self.recognizer.SetWords(True)
+        self.cpu_seconds = 0.0
+
+    # Function is used to give a frame of the utterance to the model.
+    def accept(self, frame):
+        start = time.process_time()
+        self.recognizer.AcceptWaveform(frame)
+        self.cpu_seconds += time.process_time() - start
+
+    # Function is used to end the utterance. It returns the keyword that was said, or None.
+    def finish(self):
+        start = time.process_time()
+        result = json.loads(self.recognizer.FinalResult())
+        self.recognizer.Reset()
+        self.cpu_seconds += time.process_time() - start
+        words = result.get('result', [])
+        text = result.get('text', '')
+        if not words or np.mean([word.get('conf', 0.0) for word in words]) < self.min_confidence:
+            return None
+        for keyword in self.keywords:
+            if keyword in text:
+                return keyword
+        return None
+
+# Class is used to spot the wake up and turn off words on the device. The keyword model only runs on the utterances found by the energy gate.
+class WakeWordDetector():
+
+    def __init__(self, spotter, gate=None):
+        self.spotter = spotter
+        self.gate = gate if gate is not None else EnergyGate()
+
+    # Function is used to process one microphone frame. It returns the keyword when an utterance with a keyword ended.
+    def process_frame(self, frame):
+        frames, ended = self.gate.process(frame)
+        for utterance_frame in frames:
+            self.spotter.accept(utterance_frame)
+        if ended:
+            return self.spotter.finish()
+        return None
+
+    # Function is used to read frames until a keyword is said.
+    def listen(self, read_frame):
+        while True:
+            keyword = self.process_frame(read_frame())
+            if keyword is not None:
+                return keyword
+
+    # Function is used to report how much of the audio reached the keyword model.
+    def get_stats(self):
+        return {
+            'frames': self.gate.frames,
+            'gated_fraction': round(self.gate.gated_frames / self.gate.frames, 4) if self.gate.frames else 0,
+            'noise_floor': round(self.gate.noise_floor or 0.0, 1),
+            'model_cpu_seconds': round(self.spotter.cpu_seconds, 3),
+        }
+
+# Function is used to read a WAV file as 16-bit mono PCM at the sample rate of the detector.
+def read_wav(path, sample_rate=wake_sample_rate):
+    with wave.open(path, "rb") as f:
+        channels, width, rate = f.getnchannels(), f.getsampwidth(), f.getframerate()
+        data = f.readframes(f.getnframes())
+    if width != 2:
+        raise ValueError(f"""{path} must be 16-bit PCM""")
+    samples = np.frombuffer(data, dtype='int16').reshape(-1, channels).mean(axis=1)
+    if rate != sample_rate:
+        samples = np.interp(np.arange(0, len(samples), rate / sample_rate), np.arange(len(samples)), samples)
+    return samples.astype('int16').tobytes()
+
+# Function is used to get the keyword expected in a fixture from its folder: wake_up/, turn_off/ or any other folder for audio without keyword.
+def expected_keyword(path):
+    folder = os.path.basename(os.path.dirname(path)).replace('_', ' ')
+    return folder if folder in wake_keywords else None
+
+# Function is used to run the detector on WAV fixtures and report the false accepts, the false rejects and the CPU usage.
+def evaluate_fixtures(fixture_dir, model_path=wake_model_path, **gate_options):
+    spotter = KeywordSpotter(model_path)
+    paths = sorted(glob.glob(f"""{fixture_dir}/**/*.wav""", recursive=True))
+    positives = negatives = false_rejects = false_accepts = 0
+    audio_seconds = negative_seconds = 0.0
+    files = []
+    gated = total = 0
+    start = time.process_time()
+    for path in paths:
+        detector = WakeWordDetector(spotter, EnergyGate(**gate_options))
+        audio = read_wav(path)
+        frame_bytes = detector.gate.frame_samples * 2
+        # Silence is added after the audio, so the last utterance is ended.
+        audio += b'\x00' * frame_bytes * (detector.gate.hangover_frames + 1)
+        detected = []
+        for i in range(0, len(audio) - frame_bytes + 1, frame_bytes):
+            keyword = detector.process_frame(audio[i:i + frame_bytes])
+            if keyword is not None:
+                detected.append(keyword)
+        seconds = len(audio) / 2 / wake_sample_rate
+        audio_seconds += seconds
+        gated += detector.gate.gated_frames
+        total += detector.gate.frames
+        expected = expected_keyword(path)
+        if expected is None:
+            negatives += 1
+            negative_seconds += seconds
+            false_accepts += bool(detected)
+        else:
+            positives += 1
+            false_rejects += expected not in detected
+            false_accepts += any(keyword != expected for keyword in detected)
+        files.append({'file': os.path.relpath(path, fixture_dir), 'expected': expected, 'detected': detected})
+    cpu_seconds = time.process_time() - start
+    return {
+        'files': len(paths),
+        'positives': positives,
+        'negatives': negatives,
+        'false_reject_rate': round(false_rejects / positives, 4) if positives else None,
+        'false_accept_rate': round(false_accepts / len(paths), 4) if paths else None,
+        'false_accepts_per_hour': round(false_accepts / (negative_seconds / 3600), 2) if negative_seconds else None,
+        'audio_seconds': round(audio_seconds, 2),
+        'cpu_seconds': round(cpu_seconds, 3),
+        'real_time_factor': round(cpu_seconds / audio_seconds, 4) if audio_seconds else None,
+        'model_cpu_seconds': round(spotter.cpu_seconds, 3),
+        'gated_fraction': round(gated / total, 4) if total else 0,
+        'results': files,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Test the on-device wake word detector on WAV fixtures (wake_up/, turn_off/ and folders of audio without keyword).')
+    parser.add_argument('fixtures', help='Folder of the WAV fixtures.')
+    parser.add_argument('--model', default=wake_model_path, help='Folder of the Vosk model.')
+    parser.add_argument('--ratio', type=float, default=3.0, help='Energy above the noise floor needed for a voiced frame.')
+    parser.add_argument('--min-energy', type=float, default=150, help='Lowest energy of a voiced frame.')
+    args = parser.parse_args()
+    print(json.dumps(evaluate_fixtures(args.fixtures, args.model, ratio=args.ratio, min_energy=args.min_energy), indent=2))
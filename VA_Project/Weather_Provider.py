@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Apr 22 18:54:09 2024
+
+@author: jlkc1
+"""
+
+import os
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from Lazy_Import import lazy_import
+from Tracing import metrics
+
+geocoder = lazy_import('geocoder')
+
+weather_url = 'https://api.openweathermap.org/data/2.5/weather'
+weather_api_key = os.environ.get('OPENWEATHERMAP_API_KEY', 'ea41b7fca1bc919a190c2a37a6cbcfbe')
+# (connect, read) timeouts of every request, in seconds.
+request_timeout = (2, 4)
+location_ttl = 6 * 60 * 60
+weather_ttl = 10 * 60
+# A value older than this is not used, even when the refresh fails.
+max_stale = 6 * 60 * 60
+
+# Class is used to get the location and the weather with a pooled HTTP session, separate caches and a stale-while-revalidate fallback.
+class WeatherProvider():
+
+    def __init__(self, location_ttl=location_ttl, weather_ttl=weather_ttl, max_stale=max_stale, timeout=request_timeout):
+        self.location_ttl = location_ttl
+        self.weather_ttl = weather_ttl
+        self.max_stale = max_stale
+        self.timeout = timeout
+        self.session = requests.Session()
+        retries = Retry(total=1, backoff_factor=0.2, status_forcelist=[502, 503, 504], allowed_methods=['GET'])
+        self.session.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=retries))
+        self.session.mount('http://', HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=retries))
+        # Cached values are stored as (value, time it was fetched).
+        self.location = None
+        self.weather = None
+        self.lock = threading.Lock()
+        self.refresh_thread = None
+
+    # Function is used to get the age of a cached value in seconds.
+    def age(self, cached):
+        return time.monotonic() - cached[1]
+
+    # Function is used to get the location of the Virtual Assistant from its IP address. The last known location is used if the lookup fails.
+    def get_location(self):
+        if self.location is not None and self.age(self.location) < self.location_ttl:
+            return self.location[0]
+        try:
+            metrics.increment('network_calls_total', service='geocoder')
+            myloc = geocoder.ip('me', timeout=self.timeout, session=self.session)
+            if myloc.ok and myloc.lat is not None:
+                self.location = ((myloc.lat, myloc.lng), time.monotonic())
+        except Exception:
+            pass
+        if self.location is not None:
+            return self.location[0]
+        return None
+
+    # Function is used to call the weather API for the current location.
+    def fetch_weather(self):
+        location = self.get_location()
+        if location is None:
+            raise RuntimeError('The location of the Virtual Assistant is unknown.')
+        lat, lng = location
+        metrics.increment('network_calls_total', service='openweathermap')
+        response = self.session.get(weather_url, params={'lat': lat, 'lon': lng, 'appid': weather_api_key, 'units': 'metric'}, timeout=self.timeout)
+        response.raise_for_status()
+        if 'application/json' not in response.headers.get('Content-Type', ''):
+            raise RuntimeError('The weather API did not return JSON.')
+        return response.json()
+
+    # Function is used to refresh the cached weather. On failure the previous value is kept.
+    def refresh(self):
+        try:
+            self.weather = (self.fetch_weather(), time.monotonic())
+        except Exception:
+            pass
+
+    # Function is used to refresh the weather in the background, e.g. as soon as the mood of the user is known.
+    def prefetch(self):
+        with self.lock:
+            if self.weather is not None and self.age(self.weather) < self.weather_ttl:
+                return self.refresh_thread
+            if self.refresh_thread is None or not self.refresh_thread.is_alive():
+                self.refresh_thread = threading.Thread(target=self.refresh, daemon=True)
+                self.refresh_thread.start()
+            return self.refresh_thread
+
+    # Function is used to get the weather. A stale value is returned right away while it is refreshed in the background. None is returned if there is no usable value.
+    def get_weather(self):
+        weather = self.weather
+        if weather is not None and self.age(weather) < self.weather_ttl:
+            metrics.increment('cache_hits_total', cache='weather')
+            return weather[0]
+        metrics.increment('cache_misses_total', cache='weather')
+        refresh_thread = self.prefetch()
+        if weather is not None and self.age(weather) < self.max_stale:
+            return weather[0]
+        if refresh_thread is not None:
+            refresh_thread.join(sum(self.timeout) * 3)
+        if self.weather is not None and self.age(self.weather) < self.max_stale:
+            return self.weather[0]
+        return None